@@ -0,0 +1,257 @@
+"""
+TemplateMatcher 基准测试
+在录制的帧序列（或由样板合成的帧）上回放 find_target / find_all_targets，
+统计各目标、各样板的匹配耗时和命中准确率，并与保存的基线比较，出现退化时返回非零退出码。
+不需要模拟器和桌面环境，可在 Linux 上无头运行。
+
+用法:
+    python benchmark_matcher.py --synthetic 20
+    python benchmark_matcher.py --frames recordings/run1 --resolutions 1.0 0.75
+    python benchmark_matcher.py --synthetic 20 --baseline bench_baseline.json --update-baseline
+
+录制目录中可放置 labels.json 标注期望结果:
+    {"frame_001.png": {"login": [x, y], "start": null}, ...}
+未标注的目标不计入准确率。
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from modules.capture_backends import RawFrameCapture, ReplayCapture
+from modules.template_matcher import TemplateMatcher
+
+# 命中坐标与标注相差不超过该像素数（按分辨率缩放）视为正确
+POSITION_TOLERANCE = 10
+
+
+def load_recorded(path):
+    """读取录制的帧序列及标注"""
+    replay = ReplayCapture(path)
+    labels = {}
+    labels_path = os.path.join(path, "labels.json")
+    if os.path.exists(labels_path):
+        with open(labels_path, 'r', encoding='utf-8') as f:
+            labels = json.load(f)
+    return replay.frames, [labels.get(name, {}) for name in replay.names]
+
+
+def make_synthetic(assets_dir, count, size=(1080, 1920), seed=0):
+    """
+    用样板合成测试帧：随机背景上随机放置部分目标，标注全部目标的期望结果
+    """
+    matcher = TemplateMatcher(assets_dir=assets_dir, capture_backend=RawFrameCapture())
+    rng = np.random.default_rng(seed)
+    names = [name for name, templates in matcher.templates.items() if templates]
+    frames, labels = [], []
+    for _ in range(count):
+        frame = cv2.GaussianBlur((rng.random(size) * 255).astype(np.uint8), (7, 7), 0)
+        label = {name: None for name in names}
+        # 按网格放置，保证目标互不重叠
+        cells = rng.permutation(12)[:rng.integers(1, 5)]
+        for cell, name in zip(cells, rng.choice(names, size=len(cells), replace=False)):
+            template = matcher.templates[name][rng.integers(len(matcher.templates[name]))]
+            h, w = template.shape[:2]
+            x = int(cell % 4 * size[1] // 4 + rng.integers(0, max(size[1] // 4 - w, 1)))
+            y = int(cell // 4 * size[0] // 3 + rng.integers(0, max(size[0] // 3 - h, 1)))
+            frame[y:y + h, x:x + w] = template
+            label[name] = [x + w // 2, y + h // 2]
+        frames.append(frame)
+        labels.append(label)
+    return frames, labels
+
+
+def to_gray(frame):
+    if frame.ndim == 2:
+        return np.ascontiguousarray(frame)
+    code = cv2.COLOR_BGRA2GRAY if frame.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+    return cv2.cvtColor(frame, code)
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def run_resolution(assets_dir, matcher_options, frames, labels, resolution, repeat):
+    """
+    在某个分辨率下运行一轮基准
+
+    返回:
+        {"targets": {目标: {...}}, "templates": {"目标#序号": 中位耗时ms}, "find_all": {...}}
+    """
+    # 回放帧按分辨率缩放，样板使用同一比例，模拟不同分辨率的模拟器
+    options = dict(matcher_options)
+    options.update({
+        "template_scales": [resolution],
+        "capture_backend": RawFrameCapture(),
+        # 基准只测量完整搜索，关闭跨调用的状态和磁盘缓存
+        "prior_file": None,
+        "scale_cache_file": None,
+        "bundle_file": None,
+        "change_detection": False,
+        "match_cache_size": 0,
+        "stats_file": None,
+        "adaptive_order": False,
+    })
+    matcher = TemplateMatcher(assets_dir=assets_dir, **options)
+
+    scaled = []
+    for frame, label in zip(frames, labels):
+        gray = to_gray(frame)
+        if resolution != 1.0:
+            gray = cv2.resize(gray, None, fx=resolution, fy=resolution, interpolation=cv2.INTER_AREA)
+        scaled.append((gray, {name: (None if pos is None else [pos[0] * resolution, pos[1] * resolution])
+                              for name, pos in label.items()}))
+
+    targets = {}
+    tolerance = POSITION_TOLERANCE * max(resolution, 1.0)
+    for name, templates in matcher.templates.items():
+        if not templates:
+            continue
+        latencies, correct, scored = [], 0, 0
+        for gray, label in scaled:
+            for _ in range(repeat):
+                # 每次都从完整搜索开始
+                matcher.location_priors = {}
+                matcher.reset_scale()
+                pos, ms = timed(matcher.find_target, name, gray)
+                latencies.append(ms)
+            if name in label:
+                scored += 1
+                expected = label[name]
+                if expected is None:
+                    correct += pos is None
+                elif pos is not None:
+                    correct += abs(pos[0] - expected[0]) <= tolerance and abs(pos[1] - expected[1]) <= tolerance
+        targets[name] = {
+            "median_ms": statistics.median(latencies),
+            "max_ms": max(latencies),
+            "accuracy": correct / scored if scored else None,
+        }
+
+    # 单个样板的整帧匹配耗时
+    templates_ms = {}
+    for name, templates in matcher.templates.items():
+        for index in range(len(templates)):
+            latencies = [timed(matcher._locate, name, index, gray)[1]
+                         for gray, _ in scaled for _ in range(repeat)]
+            templates_ms[f"{name}#{index + 1}"] = statistics.median(latencies)
+
+    find_all = {}
+    for name, templates in matcher.templates.items():
+        if templates:
+            latencies = [timed(matcher.find_all_targets, name, gray)[1] for gray, _ in scaled]
+            find_all[name] = statistics.median(latencies)
+
+    return {"targets": targets, "templates": templates_ms, "find_all": find_all}
+
+
+def print_report(results):
+    for resolution, result in results.items():
+        print("")
+        print(f"===== 分辨率 x{resolution} =====")
+        print(f"{'目标':<22}{'中位(ms)':>10}{'最大(ms)':>10}{'准确率':>8}{'全部匹配(ms)':>14}")
+        for name, stats in result["targets"].items():
+            accuracy = "-" if stats["accuracy"] is None else f"{stats['accuracy']:.0%}"
+            print(f"{name:<22}{stats['median_ms']:>10.2f}{stats['max_ms']:>10.2f}{accuracy:>8}"
+                  f"{result['find_all'].get(name, 0):>14.2f}")
+        print("--- 单个样板整帧匹配 ---")
+        for key, ms in result["templates"].items():
+            print(f"{key:<22}{ms:>10.2f}")
+
+
+def compare_baseline(results, baseline, tolerance):
+    """
+    与基线比较
+
+    返回:
+        退化项描述列表
+    """
+    regressions = []
+    for resolution, result in results.items():
+        base = baseline.get(resolution)
+        if not base:
+            continue
+        for name, stats in result["targets"].items():
+            old = base["targets"].get(name)
+            if not old:
+                continue
+            # 留 1ms 的绝对余量，避免极短耗时的抖动被误判
+            limit = old["median_ms"] * (1 + tolerance) + 1.0
+            if stats["median_ms"] > limit:
+                regressions.append(f"x{resolution} {name}: 耗时 {stats['median_ms']:.2f}ms > 基线上限 {limit:.2f}ms")
+            if old["accuracy"] is not None and stats["accuracy"] is not None and stats["accuracy"] < old["accuracy"]:
+                regressions.append(f"x{resolution} {name}: 准确率 {stats['accuracy']:.0%} < 基线 {old['accuracy']:.0%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TemplateMatcher 基准测试")
+    parser.add_argument("--frames", help="录制帧目录（图片或 .npy），可含 labels.json")
+    parser.add_argument("--synthetic", type=int, default=0, help="未指定 --frames 时合成的帧数")
+    parser.add_argument("--assets", default="assets", help="样板目录")
+    parser.add_argument("--config", default="config.json", help="读取其中 matcher 段作为匹配器参数")
+    parser.add_argument("--resolutions", type=float, nargs="+", default=[1.0], help="测试的分辨率比例")
+    parser.add_argument("--repeat", type=int, default=3, help="每帧重复次数")
+    parser.add_argument("--baseline", help="基线文件路径")
+    parser.add_argument("--update-baseline", action="store_true", help="用本次结果覆盖基线")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="允许的耗时退化比例")
+    parser.add_argument("--output", help="将结果另存为 JSON")
+    args = parser.parse_args()
+
+    matcher_options = {}
+    if os.path.exists(args.config):
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        matcher_options = config.get("matcher", {})
+        matcher_options["confidence"] = config.get("settings", {}).get("click_confidence", 0.8)
+
+    if args.frames:
+        frames, labels = load_recorded(args.frames)
+    else:
+        frames, labels = make_synthetic(args.assets, args.synthetic or 10)
+    if not frames:
+        print("没有可用的帧")
+        sys.exit(1)
+    print(f"帧数: {len(frames)}，分辨率: {args.resolutions}，重复: {args.repeat}")
+
+    results = {}
+    for resolution in args.resolutions:
+        results[str(resolution)] = run_resolution(args.assets, matcher_options, frames, labels,
+                                                  resolution, args.repeat)
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        if args.update_baseline or not os.path.exists(args.baseline):
+            with open(args.baseline, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            print(f"\n基线已写入: {args.baseline}")
+        else:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+            regressions = compare_baseline(results, baseline, args.tolerance)
+            if regressions:
+                print("\n[退化] 与基线相比:")
+                for line in regressions:
+                    print(f"  {line}")
+                sys.exit(1)
+            print("\n[通过] 未发现相对基线的退化")
+
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
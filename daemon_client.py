@@ -0,0 +1,85 @@
+"""
+常驻模式的客户端
+把账号切换请求发给 `python main_controller.py --daemon` 启动的守护进程，
+输出与 main_controller.py 相同的 RESULT 行并以相同的退出码退出。
+只依赖标准库，不导入 cv2 等模块，启动开销很小。
+守护进程未运行时，自动改为直接运行 main_controller.py。
+
+用法:
+    python daemon_client.py              # 执行一次账号切换
+    python daemon_client.py --ping       # 检查守护进程是否存活
+    python daemon_client.py --shutdown   # 停止守护进程
+
+退出码: 0 成功，1 失败，2 用户中断，3 异常（与 main_controller.py 一致）
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_daemon_options(config_path):
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('daemon', {})
+    except (OSError, ValueError):
+        return {}
+
+
+def request(host, port, cmd, connect_timeout=2):
+    """
+    发送一条请求并等待结果（账号切换可能持续数分钟，连接建立后不设超时）
+
+    返回:
+        (退出码, RESULT 行)
+
+    异常:
+        ConnectionRefusedError / socket.timeout: 守护进程未运行
+    """
+    with socket.create_connection((host, port), timeout=connect_timeout) as conn:
+        conn.settimeout(None)
+        conn.sendall((json.dumps({"cmd": cmd}) + "\n").encode('utf-8'))
+        line = conn.makefile('r', encoding='utf-8').readline()
+    if not line:
+        return 3, "RESULT: ERROR - 守护进程在返回结果前断开了连接"
+    reply = json.loads(line)
+    return reply["code"], reply["result"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="常驻模式客户端")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--ping", action="store_true", help="检查守护进程是否存活")
+    group.add_argument("--shutdown", action="store_true", help="停止守护进程")
+    parser.add_argument("--config", default=os.path.join(BASE_DIR, "config.json"), help="配置文件")
+    args = parser.parse_args()
+
+    options = load_daemon_options(args.config)
+    host = options.get('host', '127.0.0.1')
+    port = options.get('port', 47321)
+    cmd = "ping" if args.ping else "shutdown" if args.shutdown else "run"
+
+    try:
+        code, line = request(host, port, cmd)
+    except (ConnectionRefusedError, socket.timeout):
+        if cmd != "run":
+            print(f"守护进程未运行 ({host}:{port})")
+            sys.exit(1)
+        print(f"[CLIENT] 守护进程未运行 ({host}:{port})，直接运行 main_controller.py")
+        sys.exit(subprocess.call([sys.executable, os.path.join(BASE_DIR, "main_controller.py")], cwd=BASE_DIR))
+    except (OSError, ValueError) as e:
+        code, line = 3, f"RESULT: ERROR - 与守护进程通信失败: {e}"
+    except KeyboardInterrupt:
+        # 只中断了客户端的等待，守护进程中的流程仍会执行完
+        code, line = 2, "RESULT: INTERRUPTED"
+
+    print(line)
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+模拟的 adb 命令行
+以 SimulatedGame 模拟的游戏界面作为设备，支持 AdbDevice 用到的命令，
+用于在没有模拟器的环境下测试 ADB 截屏/输入后端和 adb 就绪探针:
+
+    exec-out sh                        常驻 shell，逐行执行 screencap / input tap / echo / getprop
+    shell getprop sys.boot_completed   单次命令
+
+用法（作为 adb_path 传入）:
+    ["python", "fake_adb.py", "--speed", "10"]
+"""
+import argparse
+import os
+import struct
+import sys
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from modules.flow_simulator import DEFAULT_SCREENS, SimulatedGame
+
+
+class ScaledClock:
+    """按倍速流逝的真实时钟，让模拟界面的切换耗时缩短"""
+
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self.started = time.monotonic()
+
+    def monotonic(self):
+        return (time.monotonic() - self.started) * self.speed
+
+
+def screencap(game, header_size):
+    """按 screencap 原始格式输出一帧: 宽、高、格式(RGBA_8888)[、色彩空间] + 像素"""
+    rgba = cv2.cvtColor(game.grab(), cv2.COLOR_GRAY2RGBA)
+    height, width = rgba.shape[:2]
+    header = struct.pack("<III", width, height, 1)
+    if header_size == 16:
+        header += struct.pack("<I", 0)
+    return header + rgba.tobytes()
+
+
+def execute(game, command, header_size):
+    args = command.split()
+    if not args:
+        return b""
+    if args[0] == "screencap" and "-p" not in args:
+        return screencap(game, header_size)
+    if args[:2] == ["input", "tap"]:
+        game.click(int(args[2]), int(args[3]))
+        return b""
+    if args[0] == "echo":
+        return (" ".join(args[1:]) + "\n").encode()
+    if args[:2] == ["getprop", "sys.boot_completed"]:
+        return b"1\n"
+    return f"{args[0]}: not found\n".encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟的 adb")
+    parser.add_argument("--speed", type=float, default=1.0, help="模拟界面的时间倍速")
+    parser.add_argument("--initial", default="desktop", choices=sorted(DEFAULT_SCREENS), help="初始画面")
+    parser.add_argument("--header", type=int, default=16, choices=(12, 16), help="screencap 帧头字节数")
+    parser.add_argument("--assets", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets"))
+    parser.add_argument("-s", dest="serial", help="设备序列号（忽略）")
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="adb 子命令")
+    args = parser.parse_args()
+
+    game = SimulatedGame(ScaledClock(args.speed), assets_dir=args.assets, initial=args.initial)
+    out = sys.stdout.buffer
+
+    if args.command[:2] == ["exec-out", "sh"]:
+        for line in sys.stdin:
+            for command in line.strip().split(";"):
+                out.write(execute(game, command.strip(), args.header))
+            out.flush()
+        return
+    if args.command and args.command[0] in ("shell", "exec-out"):
+        out.write(execute(game, " ".join(args.command[1:]), args.header))
+        return
+    sys.stderr.write(f"fake_adb: 不支持的命令 {args.command}\n")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,19 @@
+import argparse
+import asyncio
+import io
 import json
 import os
+import pstats
+import socket
 import sys
 import time
+import traceback
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from modules import logger, emulator_manager, GameBot
+from modules import logger, emulator_manager, readiness, GameBot
+from modules.async_engine import AsyncStepEngine
+from modules.tracer import Tracer
 
 def load_config(config_path="config.json"):
     if not os.path.exists(config_path):
@@ -14,71 +22,216 @@ def load_config(config_path="config.json"):
     with open(config_path, 'r', encoding='utf-8') as f:
         return json.load(f)
 
-def main():
-    try:
-        config = load_config()
-        log = logger.setup_logger(config['settings']['log_file'])
-        
-        log.info("=" * 50)
-        log.info("LDPlayer 游戏自动化系统启动")
-        log.info("=" * 50)
-        
-        exe_path_conf = config['paths']['dnplayer_exe']
-        if isinstance(exe_path_conf, list):
-            log.info(f"配置的模拟器路径: {', '.join(exe_path_conf)}")
-        else:
-            log.info(f"配置的模拟器路径: {exe_path_conf}")
-        log.info(f"识别精度: {config['settings']['click_confidence']}")
-        
-        log.info("")
-        log.info("[步骤1] 执行模拟器重启...")
-        emulator_manager.restart_dnplayer(
+def parse_args():
+    parser = argparse.ArgumentParser(description="LDPlayer 游戏自动化")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="记录各阶段耗时并导出为 Chrome trace JSON（chrome://tracing 或 Perfetto 打开）")
+    parser.add_argument("--profile", nargs="?", const="profiles", metavar="DIR",
+                        help="为每个步骤采集 cProfile 数据并保存到目录（默认 profiles），同时开启 --trace；"
+                             "cProfile 只记录主线程，采集期间并行匹配、后台截屏、后台中断检测和异步引擎均不启用")
+    parser.add_argument("--daemon", action="store_true",
+                        help="常驻模式：保持匹配器及其缓存常驻内存，通过本地端口接收 daemon_client.py 的执行请求")
+    return parser.parse_args()
+
+def save_diagnostics(bot, tracer, args, log):
+    """导出耗时追踪和每个步骤的 cProfile 数据"""
+    if tracer.enabled:
+        tracer.log_summary(log)
+        trace_path = args.trace or os.path.join(args.profile, "trace.json")
+        os.makedirs(os.path.dirname(os.path.abspath(trace_path)), exist_ok=True)
+        tracer.export_chrome_trace(trace_path)
+        log.info(f"耗时追踪已导出: {trace_path}")
+    
+    if args.profile and bot.step_profiles:
+        os.makedirs(args.profile, exist_ok=True)
+        for index, step_name, profiler in bot.step_profiles:
+            profile_path = os.path.join(args.profile, f"step{index}.prof")
+            profiler.dump_stats(profile_path)
+            # 日志中只记录累计耗时最高的几个函数，完整数据用 pstats / snakeviz 查看
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(10)
+            log.info(f"[性能分析] 步骤 {index} {step_name} -> {profile_path}\n{stream.getvalue()}")
+
+def build_bot(config, args, log):
+    """按配置创建 GameBot（加载全部样板，是冷启动的主要开销）"""
+    return GameBot(
+        confidence=config['settings']['click_confidence'],
+        assets_dir="assets",
+        log=log,
+        matcher_options=config.get('matcher'),
+        scheduler_options=config.get('scheduler'),
+        interrupt_options=config.get('interrupts'),
+        capture_options=config.get('capture'),
+        input_backend=config.get('input', {}).get('backend'),
+        input_options=config.get('input', {}).get('options'),
+        profile=bool(args.profile)
+    )
+
+def run_switch(config, args, log, bot=None):
+    """
+    执行一次完整的账号切换：重启模拟器、等待就绪、运行自动化流程
+    
+    参数:
+        bot: 常驻模式下复用的 GameBot，为None则在模拟器重启后新建
+    
+    返回:
+        (退出码, RESULT 行)：0 成功，1 失败，2 用户中断，3 异常
+    """
+    log.info("=" * 50)
+    log.info("LDPlayer 游戏自动化系统启动")
+    log.info("=" * 50)
+    
+    exe_path_conf = config['paths']['dnplayer_exe']
+    if isinstance(exe_path_conf, list):
+        log.info(f"配置的模拟器路径: {', '.join(exe_path_conf)}")
+    else:
+        log.info(f"配置的模拟器路径: {exe_path_conf}")
+    log.info(f"识别精度: {config['settings']['click_confidence']}")
+    
+    log.info("")
+    tracer = Tracer(enabled=bool(args.trace or args.profile))
+    
+    log.info("[步骤1] 执行模拟器重启...")
+    with tracer.span("emulator_restart"):
+        emulator = emulator_manager.restart_dnplayer(
             dnplayer_path=config['paths']['dnplayer_exe'],
             auto_find_registry=config['settings'].get('auto_find_from_registry', True),
-            log=log
+            log=log,
+            options=config.get('emulator')
         )
-        
-        log.info("")
-        log.info("[步骤2] 启动游戏自动化流程...")
-        log.info("流程: DL_entry -> start -> user -> switch -> login(第2个) -> IT_float -> continue")
-        log.info("")
-        
-        bot = GameBot(
-            confidence=config['settings']['click_confidence'],
-            assets_dir="assets",
-            log=log
-        )
-        
+    
+    log.info("")
+    log.info("[步骤2] 启动游戏自动化流程...")
+    log.info("流程: DL_entry -> start -> user -> switch -> login(第2个) -> IT_float -> continue")
+    log.info("")
+    
+    if bot is None:
+        bot = build_bot(config, args, log)
+    bot.tracer = bot.matcher.tracer = tracer
+    bot.step_profiles = []
+    
+    try:
         try:
-            result = bot.run()
-            log.info("")
+            # 模拟器就绪之前不做模板匹配，避免对黑屏和加载画面做整帧匹配
+            readiness_options = config.get('readiness', {})
+            if readiness_options.get('enabled', True):
+                gate = readiness.create_gate(readiness_options, capture=bot.matcher.capture_frame,
+                                             handle=emulator, log=log)
+                with tracer.span("readiness"):
+                    if not gate.wait():
+                        log.warning("模拟器未通过就绪检测，改由画面识别继续等待")
             
-            if result["success"]:
-                log.info(f"[成功] 账号切换完成! 共执行 {result['completed_steps']}/{result['total_steps']} 步")
-                print(f"RESULT: SUCCESS | 步骤: {result['completed_steps']}/{result['total_steps']}")
-                sys.exit(0)
+            engine_options = dict(config.get('async_engine', {}))
+            use_async = engine_options.pop('enabled', False)
+            if use_async and args.profile:
+                log.info("性能分析已开启，改用同步流程（异步引擎的工作分布在多个线程中）")
+                use_async = False
+            if use_async:
+                # 截屏、中断检测和步骤检测并发执行，步骤间等待在下一步画面出现时提前结束
+                result = asyncio.run(AsyncStepEngine(bot, log=log, **engine_options).run())
             else:
-                log.error(f"[失败] 流程中断于: {result['failed_step']}")
-                print(f"RESULT: FAILED | 失败步骤: {result['failed_step']} | 已完成: {result['completed_steps']}/{result['total_steps']}")
-                sys.exit(1)
-                
-        except KeyboardInterrupt:
-            log.info("")
-            log.info("[中断] 用户手动停止脚本")
-            print("RESULT: INTERRUPTED")
-            sys.exit(2)
-        except Exception as e:
-            log.error(f"")
-            log.error(f"[错误] 流程执行异常: {e}")
-            print(f"RESULT: ERROR - {e}")
-            import traceback
-            traceback.print_exc()
-            sys.exit(3)
+                result = bot.run()
+        finally:
+            # 诊断数据导出失败不影响退出码
+            try:
+                save_diagnostics(bot, tracer, args, log)
+            except Exception as e:
+                log.error(f"导出耗时追踪失败: {e}")
+        log.info("")
         
+        if result["success"]:
+            log.info(f"[成功] 账号切换完成! 共执行 {result['completed_steps']}/{result['total_steps']} 步")
+            return 0, f"RESULT: SUCCESS | 步骤: {result['completed_steps']}/{result['total_steps']}"
+        log.error(f"[失败] 流程中断于: {result['failed_step']}")
+        return 1, f"RESULT: FAILED | 失败步骤: {result['failed_step']} | 已完成: {result['completed_steps']}/{result['total_steps']}"
+    
+    except KeyboardInterrupt:
         log.info("")
-        log.info("=" * 50)
-        log.info("自动化任务结束")
-        log.info("=" * 50)
+        log.info("[中断] 用户手动停止脚本")
+        return 2, "RESULT: INTERRUPTED"
+    except Exception as e:
+        log.error(f"")
+        log.error(f"[错误] 流程执行异常: {e}")
+        traceback.print_exc()
+        return 3, f"RESULT: ERROR - {e}"
+
+def serve(config, args, log):
+    """
+    常驻模式：GameBot 和匹配器只创建一次，样板、位置先验、缓存在多次执行间保持；
+    每个请求是一行 JSON，回复一行 JSON {"code": 退出码, "result": RESULT 行}
+    
+    请求:
+        {"cmd": "run"}       执行一次账号切换（配置文件每次重新读取，匹配器参数除外）
+        {"cmd": "ping"}      检查守护进程是否存活
+        {"cmd": "shutdown"}  退出守护进程
+    """
+    daemon_options = config.get('daemon', {})
+    host = daemon_options.get('host', '127.0.0.1')
+    port = daemon_options.get('port', 47321)
+    
+    bot = build_bot(config, args, log)
+    # 只监听本机地址，不接受来自其他主机的请求
+    server = socket.create_server((host, port))
+    log.info(f"守护进程已启动，监听 {host}:{port}，样板已加载")
+    
+    try:
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                # 请求行必须很快到达，避免失联的客户端占住守护进程
+                conn.settimeout(5)
+                try:
+                    request = json.loads(conn.makefile('r', encoding='utf-8').readline() or "{}")
+                except (OSError, ValueError):
+                    request = {}
+                conn.settimeout(None)
+                cmd = request.get('cmd')
+                
+                if cmd == 'run':
+                    try:
+                        config = load_config()
+                    except (OSError, ValueError) as e:
+                        log.error(f"重新读取配置失败，沿用上次的配置: {e}")
+                    try:
+                        code, line = run_switch(config, args, log, bot)
+                    except Exception as e:
+                        # 与单次运行时的致命错误一致，守护进程本身继续服务
+                        log.error(f"[致命错误] 发生未预期的错误: {e}")
+                        traceback.print_exc()
+                        code, line = 1, f"[致命错误] 发生未预期的错误: {e}"
+                elif cmd == 'ping':
+                    code, line = 0, "PONG"
+                elif cmd == 'shutdown':
+                    code, line = 0, "SHUTDOWN"
+                else:
+                    code, line = 3, f"RESULT: ERROR - 未知请求 {request}"
+                
+                print(line)
+                try:
+                    conn.sendall((json.dumps({"code": code, "result": line}, ensure_ascii=False) + "\n").encode('utf-8'))
+                except OSError as e:
+                    log.warning(f"客户端已断开，结果未送达: {e}")
+                if cmd == 'shutdown':
+                    break
+    except KeyboardInterrupt:
+        log.info("[中断] 守护进程被手动停止")
+    finally:
+        server.close()
+        log.info("守护进程已退出")
+
+def main():
+    args = parse_args()
+    try:
+        config = load_config()
+        log = logger.setup_logger(config['settings']['log_file'])
+        
+        if args.daemon:
+            serve(config, args, log)
+            sys.exit(0)
+        
+        code, line = run_switch(config, args, log)
+        print(line)
+        sys.exit(code)
         
     except FileNotFoundError as e:
         print(f"[致命错误] {e}")
@@ -90,7 +243,6 @@ def main():
         sys.exit(1)
     except Exception as e:
         print(f"[致命错误] 发生未预期的错误: {e}")
-        import traceback
         traceback.print_exc()
         sys.exit(1)
 
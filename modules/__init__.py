@@ -1,5 +1,6 @@
 from . import logger
 from . import emulator_manager
 from . import visual_bot
+from . import readiness
 from .template_matcher import TemplateMatcher
 from .game_bot import GameBot
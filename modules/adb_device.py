@@ -0,0 +1,185 @@
+import queue
+import struct
+import subprocess
+import threading
+import cv2
+import numpy as np
+
+# ADB 设备后端：通过一个常驻的 adb exec-out shell 截屏和点击
+# 截屏直接读取 screencap 的原始帧缓冲（不经过 PNG 编解码），分辨率与设备一致；
+# 点击使用 input tap，不依赖桌面窗口和鼠标，可以无头运行，多个实例也可以并行
+
+# screencap 原始格式 -> 灰度转换
+_PIXEL_FORMATS = {
+    1: (4, cv2.COLOR_RGBA2GRAY),  # RGBA_8888
+    2: (4, cv2.COLOR_RGBA2GRAY),  # RGBX_8888
+    4: (2, cv2.COLOR_BGR5652GRAY),  # RGB_565
+}
+
+
+class AdbError(RuntimeError):
+    """adb 连接断开、超时或返回了无法解析的数据"""
+
+
+class AdbDevice:
+    """
+    常驻 adb shell 连接，同时提供截屏后端接口 grab(region, dst) 和输入后端接口 click(x, y)
+    每条命令后追加结束标记，按标记切分输出；截屏数据按帧头中的尺寸读取，不会被标记误截断
+    """
+
+    MARKER = b"__ADB_DONE__"
+
+    def __init__(self, serial=None, adb_path="adb", timeout=10, log=None):
+        """
+        参数:
+            serial: 设备序列号（如 emulator-5554 或 127.0.0.1:5555），为None则使用默认设备
+            adb_path: adb 可执行文件，也可以是命令列表（如 ["python", "fake_adb.py"]）
+            timeout: 单条命令的超时（秒）
+            log: 日志对象
+        """
+        self.serial = serial
+        self.adb_path = adb_path
+        self.timeout = timeout
+        self.log = log
+        self._lock = threading.Lock()  # 截屏和点击共用一条 shell，命令需串行
+        self._shell = None
+        self._chunks = None  # 读取线程送来的输出块
+        self._buffer = b""
+
+    def _command(self, *args):
+        command = list(self.adb_path) if isinstance(self.adb_path, (list, tuple)) else [self.adb_path]
+        if self.serial:
+            command += ["-s", self.serial]
+        return command + list(args)
+
+    def _connect(self):
+        """启动常驻 shell；exec-out 不分配终端，二进制输出不会被换行转换破坏"""
+        self._shell = subprocess.Popen(self._command("exec-out", "sh"), stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0)
+        self._chunks = queue.Queue()
+        self._buffer = b""
+        # Windows 的管道不支持 select，由读取线程把输出送入队列，主线程按超时等待
+        threading.Thread(target=self._pump, args=(self._shell.stdout, self._chunks),
+                         name="adb-reader", daemon=True).start()
+        if self.log:
+            self.log.info(f"已建立 adb shell 连接 ({self.serial or '默认设备'})")
+
+    @staticmethod
+    def _pump(stream, chunks):
+        while True:
+            chunk = stream.read(1 << 16)
+            chunks.put(chunk)
+            if not chunk:
+                return
+
+    def close(self):
+        """关闭 shell 连接"""
+        if self._shell:
+            try:
+                self._shell.stdin.close()
+            except OSError:
+                pass
+            self._shell.kill()
+            self._shell.wait()
+            self._shell = None
+
+    def _fill(self):
+        try:
+            chunk = self._chunks.get(timeout=self.timeout)
+        except queue.Empty:
+            raise AdbError(f"adb 命令超时 ({self.timeout} 秒)")
+        if not chunk:
+            raise AdbError("adb shell 连接已断开")
+        self._buffer += chunk
+
+    def _read_exact(self, size):
+        while len(self._buffer) < size:
+            self._fill()
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def _read_until_marker(self):
+        marker = self.MARKER + b"\n"
+        while marker not in self._buffer:
+            self._fill()
+        data, self._buffer = self._buffer.split(marker, 1)
+        return data
+
+    def _send(self, command):
+        """发送一条命令并追加结束标记，连接断开时重连一次"""
+        line = f"{command}; echo {self.MARKER.decode()}\n".encode()
+        for attempt in range(2):
+            if self._shell is None or self._shell.poll() is not None:
+                self._connect()
+            try:
+                self._shell.stdin.write(line)
+                self._shell.stdin.flush()
+                return
+            except OSError:
+                self.close()
+                if attempt:
+                    raise AdbError("无法向 adb shell 写入命令")
+
+    def shell(self, command):
+        """
+        在常驻 shell 中执行命令
+
+        返回:
+            命令的标准输出 (bytes)
+        """
+        with self._lock:
+            try:
+                self._send(command)
+                return self._read_until_marker()
+            except AdbError:
+                # 输出流已不同步，下次重新连接
+                self.close()
+                raise
+
+    def grab(self, region=None, dst=None):
+        with self._lock:
+            try:
+                self._send("screencap")
+                width, height, pixel_format = struct.unpack("<III", self._read_exact(12))
+                if pixel_format not in _PIXEL_FORMATS:
+                    raise AdbError(f"不支持的帧格式: {pixel_format}")
+                bpp, code = _PIXEL_FORMATS[pixel_format]
+                pixels = self._read_exact(width * height * bpp)
+                tail = self._read_until_marker()
+            except AdbError:
+                self.close()
+                raise
+        # 较新的 Android 帧头多一个 4 字节的色彩空间字段，此时像素整体后移 4 字节
+        if len(tail) == 4:
+            pixels = pixels[4:] + tail
+        elif tail:
+            raise AdbError(f"截屏数据长度异常（多出 {len(tail)} 字节）")
+
+        frame = np.frombuffer(pixels, dtype=np.uint8).reshape(height, width, bpp)
+        if region:
+            left, top, w, h = region
+            frame = frame[top:top + h, left:left + w]
+        return cv2.cvtColor(frame, code, dst=dst)
+
+    def click(self, x, y):
+        self.shell(f"input tap {int(x)} {int(y)}")
+
+
+# 截屏和输入按 (序列号, adb 路径) 共用同一个设备连接
+_devices = {}
+_devices_lock = threading.Lock()
+
+
+def get_device(serial=None, adb_path="adb", **options):
+    """
+    获取共享的设备连接，同一设备的截屏后端和输入后端使用同一条 shell
+
+    参数:
+        serial, adb_path, options: 见 AdbDevice
+    """
+    key = (serial, tuple(adb_path) if isinstance(adb_path, (list, tuple)) else adb_path)
+    with _devices_lock:
+        device = _devices.get(key)
+        if device is None:
+            device = _devices[key] = AdbDevice(serial=serial, adb_path=adb_path, **options)
+        return device
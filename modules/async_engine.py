@@ -0,0 +1,360 @@
+import asyncio
+import time
+
+from .poll_scheduler import PollScheduler
+from .readiness import FrameStabilityProbe
+
+# asyncio 步骤引擎：复用 GameBot 的步骤定义、匹配器和输入后端，
+# 截屏、中断检测、步骤检测作为并发任务运行，截屏、匹配和点击放到线程池执行，不阻塞事件循环；
+# 步骤间的等待是带超时的条件（下一步的画面已出现且稳定），而不是固定时长的 sleep。
+# 每个流程只占用几个协程，一个进程可以用 run_flows 同时驱动多个流程
+
+
+class AsyncStepEngine:
+    """
+    异步执行 GameBot 的步骤图
+    计时使用事件循环的真实时钟，GameBot 的 clock/sleep 参数不起作用
+    """
+
+    def __init__(self, bot, executor=None, capture_interval=0.1, interrupt_interval=None,
+                 settle_threshold=2.0, log=None):
+        """
+        参数:
+            bot: GameBot，提供步骤图、匹配器、输入后端和中断定义
+            executor: 截屏、匹配和点击使用的线程池，为None则使用事件循环的默认线程池
+            capture_interval: 两次截屏之间的最短间隔（秒）
+            interrupt_interval: 中断检测间隔（秒），为None则沿用 bot 的中断监视器配置（默认 1.5）
+            settle_threshold: 步骤间等待时，相邻两帧缩略图平均灰度差低于该值视为画面已稳定
+            log: 日志对象，为None则使用 bot 的日志
+        """
+        self.bot = bot
+        self.executor = executor
+        self.capture_interval = capture_interval
+        if interrupt_interval is None:
+            interrupt_interval = bot.monitor.interval if bot.monitor else 1.5
+        self.interrupt_interval = interrupt_interval
+        self.settle_threshold = settle_threshold
+        self.log = log if log is not None else bot.log
+        self._frame = None
+        self._frame_at = 0.0  # 最新帧的截取时刻 (time.monotonic)
+        self._frame_cond = None
+        self._action_lock = None
+        self._last_click_at = 0.0
+
+    async def _call(self, func, *args):
+        """在线程池中执行阻塞调用"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def _capture_loop(self):
+        """截屏任务：持续截屏并唤醒等待新帧的任务"""
+        while True:
+            try:
+                frame = await self._call(self.bot.matcher.capture_frame)
+            except Exception as e:
+                if self.log:
+                    self.log.error(f"截屏异常: {e}")
+                await asyncio.sleep(1)
+                continue
+            async with self._frame_cond:
+                self._frame, self._frame_at = frame, time.monotonic()
+                self._frame_cond.notify_all()
+            await asyncio.sleep(self.capture_interval)
+
+    async def next_frame(self, newer_than=0.0, timeout=None):
+        """
+        等待一帧在指定时刻之后截取的画面
+
+        参数:
+            newer_than: 只接受在此时刻 (time.monotonic) 之后截取的帧
+            timeout: 最长等待时间（秒），为None则一直等待
+
+        返回:
+            (灰度图, 截取时刻)，超时返回 (None, None)
+        """
+        async with self._frame_cond:
+            try:
+                await asyncio.wait_for(self._frame_cond.wait_for(lambda: self._frame_at > newer_than), timeout)
+            except asyncio.TimeoutError:
+                return None, None
+            return self._frame, self._frame_at
+
+    async def _click(self, x, y):
+        await self._call(self.bot._click_location, x, y)
+        self._last_click_at = time.monotonic()
+
+    async def _interrupt_loop(self):
+        """中断检测任务：按独立的节奏匹配弹窗，与步骤检测和步骤间等待并发进行"""
+        checked_at = 0.0
+        while True:
+            frame, checked_at = await self.next_frame(max(checked_at, self._last_click_at))
+            try:
+                hits = await self._call(self.bot.matcher.find_targets, self.bot.INTERRUPT_TARGETS, frame)
+                for interrupt in self.bot.INTERRUPTS:
+                    pos = hits.get(interrupt["target"])
+                    if pos:
+                        async with self._action_lock:
+                            if self.log:
+                                self.log.info(interrupt["message"])
+                            off_x, off_y = interrupt["offset"]
+                            await self._click(pos[0] + off_x, pos[1] + off_y)
+                            # 持锁等待弹窗关闭，期间步骤不会点击
+                            await asyncio.sleep(1)
+                        break
+            except Exception as e:
+                if self.log:
+                    self.log.error(f"中断检测异常: {e}")
+            await asyncio.sleep(self.interrupt_interval)
+
+    async def wait_until(self, targets, timeout, settled=False):
+        """
+        等待任一目标出现（带超时的条件等待，替代固定时长的 sleep）
+
+        参数:
+            targets: 目标名列表
+            timeout: 最长等待时间（秒）
+            settled: 是否还要求画面已稳定（相邻两帧几乎无变化），避免在动画过程中提前结束
+
+        返回:
+            出现的目标名，超时返回 None
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        frame_at = time.monotonic()
+        current = {}
+        stability = FrameStabilityProbe(capture=lambda: current["frame"], samples=2,
+                                        threshold=self.settle_threshold, min_std=0)
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+            frame, captured_at = await self.next_frame(max(frame_at, self._last_click_at), remaining)
+            if frame is None:
+                return None
+            frame_at = captured_at
+            current["frame"] = frame
+            if settled and not stability.check():
+                continue
+            hits = await self._call(self.bot.matcher.find_targets, targets, frame)
+            for target in targets:
+                if hits[target] is not None:
+                    return target
+
+    async def execute_step(self, success_target, action_target=None, action_index=0,
+                           click_offset=None, success_check="exists", action_from_bottom=False,
+                           post_wait=2, skip_post_wait=None, wake_on=None, **scheduler_overrides):
+        """
+        GameBot.execute_step 的异步版本，参数含义相同
+
+        参数:
+            wake_on: 步骤完成后的等待期间，这些目标出现且画面稳定即提前结束等待（通常是下一步的恢复入口），
+                     为None则等满 post_wait
+
+        返回:
+            bool: 成功条件满足返回 True；超时或动作次数用尽返回 False
+        """
+        bot = self.bot
+        if self.log:
+            self.log.info(f"--- 阶段开始: 等待 {success_target} ---")
+
+        targets = success_target if isinstance(success_target, list) else [success_target]
+        # 中断由独立的任务处理，这里只匹配本步骤的目标；
+        # "消失"条件还要匹配中断目标：弹窗遮住目标时目标看起来也消失了
+        watch_interrupts = success_check != "exists"
+        batch_targets = bot.INTERRUPT_TARGETS + targets if watch_interrupts else list(targets)
+        if action_target and not action_from_bottom:
+            batch_targets.append(action_target)
+
+        # 超时和动作次数限制沿用 PollScheduler；轮询间隔用作相邻两次检测所用帧的最小时间差
+        scheduler = PollScheduler(**{**bot.scheduler_options, **scheduler_overrides})
+
+        loop_count = 0
+        action_performed = False
+        checked_at = 0.0
+        while True:
+            loop_count += 1
+            acted = False
+
+            remaining = None if scheduler.timeout is None else max(scheduler.timeout - scheduler.elapsed(), 0)
+            frame, captured_at = await self.next_frame(max(checked_at, self._last_click_at) + scheduler.interval,
+                                                       remaining)
+            if frame is None:
+                if bot._step_failed(scheduler, success_target):
+                    return False
+                continue
+            checked_at = captured_at
+            with bot.tracer.span("find_targets", targets=len(batch_targets)):
+                hits = await self._call(bot.matcher.find_targets, batch_targets, frame)
+
+            if watch_interrupts and (self._last_click_at > captured_at or
+                                     any(hits[t] is not None for t in bot.INTERRUPT_TARGETS)):
+                # 弹窗仍在画面上或刚被点击关闭，等中断任务处理完、取到新帧后再判断目标是否消失
+                if bot._step_failed(scheduler, success_target):
+                    return False
+                scheduler.on_idle()
+                continue
+
+            found_break = False
+            for target in targets:
+                if success_check == "exists" and hits[target] is not None:
+                    if self.log:
+                        self.log.info(f"*** 成功检测到 {target} ***")
+                    found_break = True
+                    break
+                if success_check != "exists" and hits[target] is None:
+                    if self.log:
+                        self.log.info(f"*** {target} 已消失 ***")
+                    found_break = True
+                    break
+            if found_break:
+                break
+
+            if bot._step_failed(scheduler, success_target):
+                return False
+
+            # 上次点击后界面可能仍在切换，冷却期间保持快速轮询，但不重复点击
+            cooling = action_target and not scheduler.can_act()
+
+            async with self._action_lock:
+                if self._last_click_at > captured_at:
+                    # 检测期间中断任务点击过，当前帧已过时，等新帧重新检测
+                    continue
+                if action_target and not cooling:
+                    if action_from_bottom:
+                        all_matches = await self._call(bot.matcher.find_all_targets, action_target, frame)
+                        pos = all_matches[-(action_index + 1)] if len(all_matches) > action_index else None
+                        label = f"{action_target} (从下往上第 {action_index + 1} 个)"
+                    else:
+                        pos = hits[action_target]
+                        label = action_target
+                    if pos:
+                        x, y = pos
+                        if self.log:
+                            self.log.info(f"点击 {label}")
+                        await self._click(x, y)
+                        acted = True
+                        if click_offset:
+                            await asyncio.sleep(0.2)
+                            off_x, off_y = click_offset
+                            await self._click(x + off_x, y + off_y)
+                    elif self.log and loop_count % 5 == 0:
+                        self.log.info(f"等待中... 未找到 {action_target}")
+
+            if acted:
+                action_performed = True
+                scheduler.on_action()
+            elif not cooling:
+                scheduler.on_idle()
+
+        wait_time = post_wait
+        if not action_performed and skip_post_wait is not None:
+            wait_time = skip_post_wait
+            if self.log:
+                self.log.info(f"检测到步骤跳过，使用缩短的等待时间: {wait_time} 秒")
+
+        if self.log:
+            self.log.info(f"阶段完成，最多等待 {wait_time} 秒...")
+        with bot.tracer.span("sleep", reason="post_wait", seconds=wait_time):
+            if wake_on:
+                woke = await self.wait_until(wake_on, wait_time, settled=True)
+                if woke and self.log:
+                    self.log.info(f"{woke} 已出现，提前结束等待")
+            else:
+                await asyncio.sleep(wait_time)
+        return True
+
+    async def run(self):
+        """
+        GameBot.run 的异步版本
+
+        返回:
+            与 GameBot.run 相同的结果字典
+        """
+        bot = self.bot
+        if self.log:
+            self.log.info("=" * 50)
+            self.log.info("开始游戏自动化流程 (asyncio)")
+            self.log.info("=" * 50)
+
+        steps = bot.build_steps()
+        self._frame, self._frame_at, self._last_click_at = None, 0.0, 0.0
+        self._frame_cond = asyncio.Condition()
+        self._action_lock = asyncio.Lock()
+        tasks = [asyncio.create_task(self._capture_loop()),
+                 asyncio.create_task(self._interrupt_loop())]
+
+        completed_steps = start_index = 0
+        failed_step = None
+        try:
+            frame, _ = await self.next_frame()
+            with bot.tracer.span("classify"):
+                start_index = await self._call(bot.classify_state, steps, frame)
+            if start_index and self.log:
+                self.log.info(f"识别到当前画面处于步骤 {start_index + 1}: {steps[start_index]['name']}，跳过前 {start_index} 步")
+            completed_steps = start_index
+
+            for i, step in enumerate(steps[start_index:], start_index + 1):
+                step_name = step["name"]
+                if self.log:
+                    self.log.info(f"\n[步骤 {i}/{len(steps)}] {step_name}")
+                bot.tracer.set_tags(step=step_name)
+                wake_on = steps[i]["resume_on"] if i < len(steps) else None
+                try:
+                    with bot.tracer.span("step"):
+                        success = await self.execute_step(
+                            success_target=step["success"],
+                            action_target=step["action"],
+                            wake_on=wake_on,
+                            **step["options"]
+                        )
+                    if success:
+                        completed_steps += 1
+                    else:
+                        failed_step = step_name
+                        if self.log:
+                            self.log.error(f"步骤失败: {step_name}")
+                        break
+                except Exception as e:
+                    failed_step = step_name
+                    if self.log:
+                        self.log.error(f"步骤异常: {step_name} - {e}")
+                    break
+                finally:
+                    bot.tracer.set_tags(step=None)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            bot.matcher.save_template_stats()
+
+        if self.log:
+            self.log.info("=" * 50)
+            if failed_step:
+                self.log.info(f"流程中断，失败步骤: {failed_step}")
+            else:
+                self.log.info("所有自动化流程执行完毕")
+            self.log.info("=" * 50)
+
+        return {
+            "success": failed_step is None,
+            "completed_steps": completed_steps,
+            "total_steps": len(steps),
+            "skipped_steps": start_index,
+            "failed_step": failed_step
+        }
+
+
+async def run_flows(engines):
+    """
+    在同一个事件循环中并发执行多个流程
+
+    参数:
+        engines: AsyncStepEngine 列表，每个绑定各自的 GameBot（独立的截屏区域或设备和输入目标）
+
+    返回:
+        各流程的结果字典列表，顺序与 engines 相同；流程抛出的异常按失败处理
+    """
+    results = await asyncio.gather(*(engine.run() for engine in engines), return_exceptions=True)
+    return [result if isinstance(result, dict) else
+            {"success": False, "completed_steps": 0, "total_steps": 0, "skipped_steps": 0,
+             "failed_step": f"异常: {result}"}
+            for result in results]
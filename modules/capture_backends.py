@@ -0,0 +1,157 @@
+import os
+import cv2
+import numpy as np
+
+from .adb_device import get_device
+
+# 截屏后端：统一提供 grab(region=None, dst=None) -> 灰度图
+# 所有后端都只做一次颜色转换，直接写入调用方提供的 dst 缓冲区（如截屏线程的环形缓冲区），
+# 不经过 PIL Image 等中间对象
+
+
+class PyAutoGUICapture:
+    """基于 pyautogui 的截屏（原有方式，兼容性最好）"""
+
+    def __init__(self):
+        # 首次截屏时才导入，无桌面环境下也能创建匹配器（只要不截屏）
+        self._pyautogui = None
+
+    def grab(self, region=None, dst=None):
+        if self._pyautogui is None:
+            import pyautogui
+            self._pyautogui = pyautogui
+        if region:
+            screen_image = self._pyautogui.screenshot(region=region)
+        else:
+            screen_image = self._pyautogui.screenshot()
+        # PIL 截图为 RGB 格式，直接转换为灰度图
+        return cv2.cvtColor(np.asarray(screen_image), cv2.COLOR_RGB2GRAY, dst=dst)
+
+
+class MSSCapture:
+    """
+    基于 mss 的截屏（Windows 为 GDI BitBlt，Linux 为 X11）
+    直接拿到 BGRA 原始字节，零拷贝包装为数组后一步转换为灰度图
+    """
+
+    def __init__(self, monitor=1):
+        """
+        参数:
+            monitor: 未指定 region 时截取的显示器序号（0 为所有显示器拼接）
+        """
+        import mss
+        self._sct = mss.mss()
+        self.monitor = monitor
+
+    def grab(self, region=None, dst=None):
+        if region:
+            left, top, width, height = region
+            area = {"left": left, "top": top, "width": width, "height": height}
+        else:
+            area = self._sct.monitors[self.monitor]
+        shot = self._sct.grab(area)
+        bgra = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+        return cv2.cvtColor(bgra, cv2.COLOR_BGRA2GRAY, dst=dst)
+
+
+class RawFrameCapture:
+    """
+    内存帧源：依次返回预先给定的帧，用于无桌面环境下的测试和回放
+    帧可以是灰度图、BGR 或 BGRA 数组
+    """
+
+    def __init__(self, frames=None, loop=True):
+        """
+        参数:
+            frames: 帧列表
+            loop: 播放到末尾后是否从头循环，否则停留在最后一帧
+        """
+        self.frames = list(frames or [])
+        self.loop = loop
+        self.index = 0
+
+    def push(self, frame):
+        """追加一帧"""
+        self.frames.append(frame)
+
+    def set_frame(self, frame):
+        """之后的截屏都返回这一帧"""
+        self.frames = [frame]
+        self.index = 0
+
+    def grab(self, region=None, dst=None):
+        if not self.frames:
+            raise RuntimeError("RawFrameCapture 中没有可用的帧")
+        if self.index >= len(self.frames):
+            self.index = 0 if self.loop else len(self.frames) - 1
+        frame = self.frames[self.index]
+        self.index += 1
+
+        if region:
+            left, top, width, height = region
+            frame = frame[top:top + height, left:left + width]
+        if frame.ndim == 2:
+            if dst is not None and dst.shape == frame.shape:
+                np.copyto(dst, frame)
+                return dst
+            return frame.copy()
+        code = cv2.COLOR_BGRA2GRAY if frame.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+        return cv2.cvtColor(frame, code, dst=dst)
+
+
+class ReplayCapture(RawFrameCapture):
+    """
+    回放录制的帧序列：目录下的图片（.png/.jpg/.bmp）或 .npy 原始帧，按文件名排序依次返回
+    """
+
+    FRAME_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.npy')
+
+    def __init__(self, path, loop=True):
+        """
+        参数:
+            path: 帧序列目录
+            loop: 播放到末尾后是否从头循环
+        """
+        self.path = path
+        self.names = sorted(f for f in os.listdir(path) if f.lower().endswith(self.FRAME_EXTENSIONS))
+        super().__init__([load_frame(os.path.join(path, name)) for name in self.names], loop)
+
+
+def load_frame(file_path):
+    """读取一帧：.npy 以内存映射方式读取原始数组，图片按原通道数解码"""
+    if file_path.lower().endswith('.npy'):
+        return np.load(file_path, mmap_mode='r')
+    frame = cv2.imdecode(np.fromfile(file_path, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if frame is None:
+        raise ValueError(f"无法读取帧: {file_path}")
+    return frame
+
+
+BACKENDS = {
+    "pyautogui": PyAutoGUICapture,
+    "mss": MSSCapture,
+    "raw": RawFrameCapture,
+    "replay": ReplayCapture,
+    "adb": get_device,
+}
+
+
+def create_capture_backend(name="pyautogui", log=None, **options):
+    """
+    按名称创建截屏后端，依赖缺失时回退到 pyautogui
+
+    参数:
+        name: 后端名称（pyautogui / mss / raw / replay / adb）
+        log: 日志对象
+        options: 传给后端构造函数的参数
+    """
+    if name not in BACKENDS:
+        if log:
+            log.warning(f"未知的截屏后端 {name}，使用 pyautogui")
+        name = "pyautogui"
+    try:
+        return BACKENDS[name](**options)
+    except ImportError as e:
+        if log:
+            log.warning(f"截屏后端 {name} 不可用 ({e})，回退到 pyautogui")
+        return PyAutoGUICapture()
@@ -1,8 +1,14 @@
+import json
 import psutil
 import subprocess
 import time
 import os
-import winreg
+
+try:
+    import winreg
+except ImportError:
+    # 非 Windows 平台没有注册表
+    winreg = None
 
 PROCESS_NAME = "dnplayer.exe"
 
@@ -12,7 +18,7 @@ def get_running_process_path(proc_name):
     如果运行，返回其可执行文件的完整路径和进程对象；
     如果不运行，返回 None, None。
     """
-    for proc in psutil.process_iter(['pid', 'name', 'exe']):
+    for proc in psutil.process_iter(['name', 'exe']):
         try:
             if proc.info['name'] and proc.info['name'].lower() == proc_name.lower():
                 return proc.info['exe'], proc
@@ -25,6 +31,8 @@ def find_path_from_registry():
     尝试从 Windows 注册表查找雷电模拟器(LDPlayer)的安装路径。
     遍历卸载列表查找包含 LDPlayer 或 雷电模拟器 的项。
     """
+    if winreg is None:
+        return None
     try:
         # 遍历卸载列表查找包含 LDPlayer 或 dnplayer 的项
         uninstall_key = r"SOFTWARE\WOW6432Node\Microsoft\Windows\CurrentVersion\Uninstall"
@@ -46,105 +54,297 @@ def find_path_from_registry():
     
     return None
 
-def kill_process(proc, log=None):
-    """优雅或强制关闭进程"""
+def _report(log, level, message):
+    """有日志对象时写日志，否则打印到控制台"""
+    if log:
+        getattr(log, level)(message)
+    else:
+        print(message)
+
+def _wait_exited(procs, timeout, interval=0.05):
+    """
+    等待进程退出，返回仍存活的进程列表
+    已成为僵尸的进程视为已退出：孙进程被父进程遗弃后由 init 回收，回收可能滞后数秒
+    """
+    deadline = time.monotonic() + timeout
+    alive = list(procs)
+    while alive:
+        gone, alive = psutil.wait_procs(alive, timeout=min(interval, max(deadline - time.monotonic(), 0)))
+        still = []
+        for p in alive:
+            try:
+                if p.status() != psutil.STATUS_ZOMBIE:
+                    still.append(p)
+            except psutil.NoSuchProcess:
+                pass
+        alive = still
+        if time.monotonic() >= deadline:
+            break
+    return alive
+
+def kill_process(proc, log=None, timeout=5):
+    """
+    关闭进程及其所有子进程，等待它们真正退出
+
+    先对整棵进程树发送 terminate，再短间隔轮询等待退出（进程一退出立即返回，
+    而不是固定等待），超时仍存活的进程强制查杀
+
+    返回:
+        bool: 进程树是否已全部退出
+    """
     try:
-        if log:
-            log.info(f"检测到 {PROCESS_NAME} 正在运行 (PID: {proc.pid})，正在关闭...")
-        else:
-            print(f"检测到 {PROCESS_NAME} 正在运行 (PID: {proc.pid})，正在关闭...")
+        _report(log, "info", f"检测到 {PROCESS_NAME} 正在运行 (PID: {proc.pid})，正在关闭...")
+        try:
+            procs = [proc] + proc.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return True
         
-        proc.terminate()  # 尝试优雅关闭
-        proc.wait(timeout=5)
+        for p in procs:
+            try:
+                p.terminate()  # 尝试优雅关闭
+            except psutil.NoSuchProcess:
+                pass
+        alive = _wait_exited(procs, timeout)
         
+        if alive:
+            _report(log, "warning", f"{len(alive)} 个进程响应超时，正在强制查杀...")
+            for p in alive:
+                try:
+                    p.kill()  # 强制关闭
+                except psutil.NoSuchProcess:
+                    pass
+            alive = _wait_exited(alive, timeout)
+        
+        if alive:
+            _report(log, "error", f"仍有进程未退出: {[p.pid for p in alive]}")
+            return False
         if log:
-            log.info(f"进程 {proc.pid} 已优雅关闭")
-    except psutil.TimeoutExpired:
-        if log:
-            log.warning("进程响应超时，正在强制查杀...")
-        else:
-            print("进程响应超时，正在强制查杀...")
-        proc.kill()  # 强制关闭
+            log.info(f"进程 {proc.pid} 及其 {len(procs) - 1} 个子进程已关闭")
+        return True
     except Exception as e:
-        if log:
-            log.error(f"关闭进程时出错: {e}")
-        else:
-            print(f"关闭进程时出错: {e}")
+        _report(log, "error", f"关闭进程时出错: {e}")
+        return False
 
 def start_process(exe_path, log=None):
-    """启动程序"""
+    """
+    启动程序
+
+    返回:
+        subprocess.Popen 进程句柄，文件不存在时返回 None
+    """
     if exe_path and os.path.exists(exe_path):
-        if log:
-            log.info(f"正在启动: {exe_path}")
-        else:
-            print(f"正在启动: {exe_path}")
+        _report(log, "info", f"正在启动: {exe_path}")
         
         # 使用 subprocess.Popen 非阻塞启动，cwd参数确保在程序目录下运行，避免缺失DLL
         work_dir = os.path.dirname(exe_path)
-        subprocess.Popen([exe_path], cwd=work_dir, shell=False)
-        return True
+        return subprocess.Popen([exe_path], cwd=work_dir, shell=False)
     else:
-        if log:
-            log.error(f"错误：找不到文件路径 {exe_path}")
-        else:
-            print(f"错误：找不到文件路径 {exe_path}")
-        return False
+        _report(log, "error", f"错误：找不到文件路径 {exe_path}")
+        return None
 
-def restart_dnplayer(dnplayer_path, auto_find_registry=True, log=None):
+class EmulatorController:
     """
-    重启雷电模拟器 - OpenClaw 版本
-    启动后立即返回，不阻塞等待，由视觉模块负责检测启动完成
-    
-    参数:
-        dnplayer_path: 模拟器可执行文件路径（支持字符串或路径列表）
-        auto_find_registry: 是否尝试从注册表自动查找路径
-        log: 日志记录器对象
+    模拟器进程控制器
+    缓存进程 PID 和可执行文件路径（可持久化到文件，下次启动时无需遍历所有进程），
+    关闭时处理整个进程树，退出和启动都通过进程事件或短间隔轮询确认，不做固定等待
     """
-    if log:
-        log.info(f"--- 开始重启 {PROCESS_NAME} ---")
     
-    exe_path, proc = get_running_process_path(PROCESS_NAME)
+    def __init__(self, process_name=PROCESS_NAME, cache_file=None, exit_timeout=5,
+                 launch_timeout=10, poll_interval=0.1, log=None):
+        """
+        参数:
+            process_name: 模拟器进程名
+            cache_file: 进程缓存文件路径 (JSON)，为None则只在内存中缓存
+            exit_timeout: 等待进程树退出的超时（秒），超时后强制查杀
+            launch_timeout: 确认新进程启动的超时（秒）
+            poll_interval: 确认启动时的轮询间隔（秒）
+            log: 日志对象
+        """
+        self.process_name = process_name
+        self.cache_file = cache_file
+        self.exit_timeout = exit_timeout
+        self.launch_timeout = launch_timeout
+        self.poll_interval = poll_interval
+        self.log = log
+        # 缓存: {"pid": 进程ID, "exe": 可执行文件路径, "create_time": 进程创建时间}
+        self.cached = self._load_cache()
+        self.handle = None  # 本控制器启动的 subprocess.Popen 句柄（可能只是已退出的启动器）
     
-    if proc:
-        kill_process(proc, log)
-        time.sleep(2)
-        start_process(exe_path, log)
-    else:
-        if log:
-            log.info(f"{PROCESS_NAME} 未运行，准备启动...")
+    def _load_cache(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            if self.log:
+                self.log.warning(f"读取进程缓存失败: {e}")
+            return {}
+    
+    def _save_cache(self):
+        if not self.cache_file:
+            return
+        try:
+            with open(self.cache_file, 'w', encoding='utf-8') as f:
+                json.dump(self.cached, f)
+        except OSError as e:
+            if self.log:
+                self.log.warning(f"保存进程缓存失败: {e}")
+    
+    def _remember(self, proc, exe_path=None):
+        """记录进程信息；PID 会被系统复用，同时记录创建时间用于校验"""
+        try:
+            self.cached = {"pid": proc.pid, "exe": exe_path or proc.exe(), "create_time": proc.create_time()}
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            self.cached = {"pid": proc.pid, "exe": exe_path or self.cached.get("exe")}
+        self._save_cache()
+    
+    def find_running(self):
+        """
+        查找正在运行的模拟器进程，优先校验缓存的 PID，失效时才遍历进程列表
+        
+        返回:
+            (可执行文件路径, psutil.Process) 或 (None, None)
+        """
+        pid = self.cached.get("pid")
+        if pid:
+            try:
+                proc = psutil.Process(pid)
+                if (proc.is_running() and proc.status() != psutil.STATUS_ZOMBIE and
+                        proc.name().lower() == self.process_name.lower() and
+                        proc.create_time() == self.cached.get("create_time", proc.create_time())):
+                    return self.cached.get("exe") or proc.exe(), proc
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                pass
+        
+        exe_path, proc = get_running_process_path(self.process_name)
+        if proc:
+            self._remember(proc, exe_path)
+        return exe_path, proc
+    
+    def stop(self, proc):
+        """关闭进程树并确认退出"""
+        stopped = kill_process(proc, self.log, timeout=self.exit_timeout)
+        if stopped:
+            # 只清掉 PID，保留路径供下次启动使用
+            self.cached = {"exe": self.cached.get("exe")}
+            self._save_cache()
+        return stopped
+    
+    def launch(self, exe_path):
+        """
+        启动模拟器并确认进程已运行
+        
+        返回:
+            psutil.Process: 实际运行的模拟器进程（启动器拉起模拟器后自行退出时，是被拉起的进程），
+            启动失败返回 None
+        """
+        handle = start_process(exe_path, self.log)
+        if handle is None:
+            return None
+        
+        deadline = time.monotonic() + self.launch_timeout
+        while True:
+            code = handle.poll()
+            if code is None:
+                try:
+                    proc = psutil.Process(handle.pid)
+                    if proc.status() != psutil.STATUS_ZOMBIE:
+                        self._remember(proc, exe_path)
+                        break
+                except psutil.NoSuchProcess:
+                    pass
+            else:
+                # 启动器可能拉起真正的模拟器进程后自行退出，此时按进程名确认
+                self.cached = {"exe": exe_path}
+                running_exe, proc = self.find_running()
+                if proc:
+                    break
+                if code != 0 or time.monotonic() >= deadline:
+                    _report(self.log, "error", f"模拟器启动失败，退出码: {code}")
+                    return None
+            if time.monotonic() >= deadline:
+                _report(self.log, "error", f"等待模拟器进程启动超时 ({self.launch_timeout} 秒)")
+                return None
+            time.sleep(self.poll_interval)
+        
+        if self.log:
+            self.log.info(f"模拟器进程已启动 (PID: {self.cached['pid']})")
+        self.handle = handle
+        return proc
+    
+    def restart(self, dnplayer_path, auto_find_registry=True):
+        """
+        重启模拟器：关闭正在运行的进程树，确认退出后立即启动
+        
+        参数:
+            dnplayer_path: 模拟器可执行文件路径（支持字符串或路径列表）
+            auto_find_registry: 是否尝试从注册表自动查找路径
         
-        # 将 dnplayer_path 统一处理为列表
+        返回:
+            psutil.Process 新的模拟器进程，启动失败返回 None
+        """
+        if self.log:
+            self.log.info(f"--- 开始重启 {self.process_name} ---")
+        
+        exe_path, proc = self.find_running()
+        
+        if proc:
+            if not self.stop(proc):
+                _report(self.log, "warning", "旧进程未能完全退出，仍尝试启动")
+            return self.launch(exe_path)
+        
+        if self.log:
+            self.log.info(f"{self.process_name} 未运行，准备启动...")
+        
+        # 将 dnplayer_path 统一处理为列表，缓存中上次使用的路径排在最后作为兜底
         paths_to_check = []
         if isinstance(dnplayer_path, list):
             paths_to_check.extend(dnplayer_path)
         elif dnplayer_path:
             paths_to_check.append(dnplayer_path)
-            
+        if self.cached.get("exe"):
+            paths_to_check.append(self.cached["exe"])
+        
         # 查找第一个存在的路径
-        valid_path = None
         for path in paths_to_check:
             if path and os.path.exists(path):
-                valid_path = path
-                break
-        
-        if valid_path:
-            start_process(valid_path, log)
-        elif auto_find_registry:
-            if log:
-                log.info("未找到配置路径，尝试从注册表查找安装路径...")
+                return self.launch(path)
+        
+        if auto_find_registry:
+            if self.log:
+                self.log.info("未找到配置路径，尝试从注册表查找安装路径...")
             
             found_path = find_path_from_registry()
             
             if found_path:
-                if log:
-                    log.info(f"从注册表找到路径: {found_path}")
-                start_process(found_path, log)
-            else:
-                if log:
-                    log.error("注册表查找失败，且所有配置路径均无效")
+                if self.log:
+                    self.log.info(f"从注册表找到路径: {found_path}")
+                return self.launch(found_path)
+            if self.log:
+                self.log.error("注册表查找失败，且所有配置路径均无效")
         else:
-            if log:
-                log.error("错误：未找到运行中的进程，且配置路径无效")
+            if self.log:
+                self.log.error("错误：未找到运行中的进程，且配置路径无效")
+        return None
+
+def restart_dnplayer(dnplayer_path, auto_find_registry=True, log=None, options=None):
+    """
+    重启雷电模拟器 - OpenClaw 版本
+    确认新进程已运行后返回，不等待模拟器内部启动完成，由后续阶段检测
+    
+    参数:
+        dnplayer_path: 模拟器可执行文件路径（支持字符串或路径列表）
+        auto_find_registry: 是否尝试从注册表自动查找路径
+        log: 日志记录器对象
+        options: 传给 EmulatorController 的参数（来自配置文件 emulator 段）
+    
+    返回:
+        psutil.Process 新的模拟器进程，启动失败返回 None
+    """
+    controller = EmulatorController(log=log, **(options or {}))
+    handle = controller.restart(dnplayer_path, auto_find_registry)
     
     if log:
         log.info("模拟器启动命令已发送，进入轮询检测模式...")
+    return handle
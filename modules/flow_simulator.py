@@ -0,0 +1,236 @@
+import os
+import threading
+import cv2
+import numpy as np
+
+# 流程模拟器：用样板图片拼出游戏各个画面，按点击切换画面，
+# 同时充当 GameBot 的截屏后端和输入后端；配合虚拟时钟，无需模拟器即可快于真实时间跑完整个流程
+
+
+class VirtualClock:
+    """
+    虚拟时钟：sleep 只推进时间、不真正等待
+    替换 GameBot / PollScheduler 的 clock 和 sleep 后，流程中的等待全部瞬间完成
+    """
+
+    def __init__(self, start=0.0):
+        self.now = start
+        self.slept = 0.0  # 累计等待的虚拟时间
+        self._lock = threading.Lock()
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        with self._lock:
+            seconds = max(seconds, 0)
+            self.now += seconds
+            self.slept += seconds
+
+    def advance(self, seconds):
+        """直接推进时间（如模拟截屏、匹配耗时）"""
+        self.sleep(seconds)
+
+
+# 默认的画面状态机，与 GameBot.build_steps() 的八个步骤对应
+#   visible: 画面上显示的目标及其中心坐标（同一目标可出现多次）
+#   on_click: 点击某个目标后切换到的画面及切换耗时（秒）；"*" 表示点击画面任意位置
+#   after: 进入本画面一段时间后自动切换到的画面（如加载画面）
+DEFAULT_SCREENS = {
+    "desktop": {
+        "visible": [("IT", (200, 300))],
+        "on_click": {"IT": ("launching", 0.5)},
+    },
+    "launching": {
+        "visible": [],
+        "on_click": {},
+        "after": ("home", 8.0),
+    },
+    "home": {
+        "visible": [("IT_float", (1200, 360)), ("DL_entry", (640, 500))],
+        "on_click": {"DL_entry": ("title", 3.0)},
+    },
+    "title": {
+        "visible": [("IT_float", (1200, 360)), ("start", (640, 600))],
+        "on_click": {"start": ("game", 2.0)},
+    },
+    "game": {
+        "visible": [("IT_float", (1200, 360)), ("user", (100, 80))],
+        "on_click": {"user": ("account", 1.5)},
+    },
+    "account": {
+        "visible": [("IT_float", (1200, 360)), ("switch_account", (640, 500))],
+        "on_click": {"switch_account": ("accounts", 1.5)},
+    },
+    "accounts": {
+        "visible": [("IT_float", (1200, 360)), ("login", (640, 300)), ("login", (640, 450))],
+        "on_click": {"login": ("logged_in", 2.0)},
+    },
+    "logged_in": {
+        "visible": [("IT_float", (1200, 360))],
+        "on_click": {"IT_float": ("float_menu", 0.1)},
+    },
+    "float_menu": {
+        "visible": [("IT_float", (1200, 360))],
+        "on_click": {"*": ("continue", 1.0)},
+    },
+    "continue": {
+        "visible": [("IT_float", (1200, 360)), ("continue", (640, 620))],
+        "on_click": {"continue": ("done", 1.0)},
+    },
+    "done": {
+        "visible": [("IT_float", (1200, 360))],
+        "on_click": {},
+    },
+}
+
+# 中断弹窗的显示位置及消除时应点击的偏移（与 GameBot.INTERRUPTS 一致）
+DEFAULT_POPUPS = {
+    "offline_retry": {"position": (640, 360), "dismiss_offset": (0, 0)},
+    "download_resources": {"position": (640, 360), "dismiss_offset": (0, 0)},
+    "update_needed": {"position": (640, 200), "dismiss_offset": (0, 300)},
+}
+
+
+class SimulatedGame:
+    """
+    模拟的游戏界面
+    提供 grab(region, dst)（截屏后端接口）和 click(x, y)（输入后端接口）
+    """
+
+    def __init__(self, clock, assets_dir="assets", screens=None, popups=None, initial="desktop",
+                 screen_size=(720, 1280), interrupts=None, seed=0, log=None):
+        """
+        参数:
+            clock: VirtualClock，画面切换的耗时按它计算
+            assets_dir: 样板目录，每个目标取其第一张图片绘制
+            screens: 画面状态机，默认 DEFAULT_SCREENS
+            popups: 中断弹窗定义，默认 DEFAULT_POPUPS
+            initial: 初始画面
+            screen_size: 画面尺寸 (高, 宽)
+            interrupts: 按时间弹出的中断列表 [(虚拟时刻, 目标名), ...]
+            seed: 背景噪声的随机种子
+            log: 日志对象
+        """
+        self.clock = clock
+        self.screens = screens or DEFAULT_SCREENS
+        self.popups = popups or DEFAULT_POPUPS
+        self.state = initial
+        self.log = log
+        self.images = self._load_images(assets_dir)
+        rng = np.random.default_rng(seed)
+        self._background = cv2.GaussianBlur(
+            (rng.random(screen_size) * 255).astype(np.uint8), (7, 7), 0)
+        self._pending = None  # (切换时刻, 目标画面)
+        self._interrupts = sorted(interrupts or [])
+        self._popup = None  # 当前显示的中断弹窗
+        self._frames = {}  # (画面, 弹窗) -> 渲染好的帧
+        self.clicks = []  # [(虚拟时刻, x, y, 命中的目标)]
+        self.history = [(clock.monotonic(), initial)]
+        self.grabs = 0
+
+    def restart(self, initial="desktop"):
+        """模拟重启模拟器：回到初始画面，清除未完成的画面切换和弹窗"""
+        self.state = initial
+        self._pending = None
+        self._popup = None
+        self.history.append((self.clock.monotonic(), initial))
+        return True
+
+    def _load_images(self, assets_dir):
+        images = {}
+        for folder_name in sorted(os.listdir(assets_dir)):
+            folder_path = os.path.join(assets_dir, folder_name)
+            if not os.path.isdir(folder_path):
+                continue
+            for filename in sorted(os.listdir(folder_path)):
+                if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp')):
+                    data = np.fromfile(os.path.join(folder_path, filename), dtype=np.uint8)
+                    image = cv2.imdecode(data, cv2.IMREAD_GRAYSCALE)
+                    if image is not None:
+                        images[folder_name] = image
+                        break
+        return images
+
+    def _layout(self):
+        """当前画面上的目标及中心坐标，弹窗在最上层"""
+        items = list(self.screens[self.state]["visible"])
+        if self._popup:
+            items.append((self._popup, self.popups[self._popup]["position"]))
+        return items
+
+    def _advance(self):
+        """按虚拟时间推进画面切换和中断弹窗"""
+        now = self.clock.monotonic()
+        while self._pending and now >= self._pending[0]:
+            switched_at, self.state = self._pending
+            self._pending = None
+            self.history.append((switched_at, self.state))
+            after = self.screens[self.state].get("after")
+            if after:
+                self._pending = (switched_at + after[1], after[0])
+        while self._interrupts and not self._popup and now >= self._interrupts[0][0]:
+            _, self._popup = self._interrupts.pop(0)
+            self.history.append((now, f"弹窗:{self._popup}"))
+
+    def _render(self):
+        key = (self.state, self._popup)
+        frame = self._frames.get(key)
+        if frame is None:
+            frame = self._background.copy()
+            for name, (cx, cy) in self._layout():
+                image = self.images[name]
+                h, w = image.shape
+                left, top = cx - w // 2, cy - h // 2
+                frame[top:top + h, left:left + w] = image
+            self._frames[key] = frame
+        return frame
+
+    def _hit(self, name, center, x, y):
+        h, w = self.images[name].shape
+        return abs(x - center[0]) <= w // 2 and abs(y - center[1]) <= h // 2
+
+    def grab(self, region=None, dst=None):
+        self._advance()
+        self.grabs += 1
+        frame = self._render()
+        if region:
+            left, top, width, height = region
+            frame = frame[top:top + height, left:left + width]
+        if dst is not None and dst.shape == frame.shape:
+            np.copyto(dst, frame)
+            return dst
+        return frame.copy()
+
+    def click(self, x, y):
+        self._advance()
+        now = self.clock.monotonic()
+
+        # 弹窗是模态的：只有点中消除位置才关闭，其余点击被吞掉
+        if self._popup:
+            popup = self.popups[self._popup]
+            off_x, off_y = popup["dismiss_offset"]
+            cx, cy = popup["position"]
+            hit = self._popup if self._hit(self._popup, (cx + off_x, cy + off_y), x, y) else None
+            self.clicks.append((now, x, y, hit))
+            if hit:
+                self.history.append((now, f"关闭:{self._popup}"))
+                self._popup = None
+            return
+
+        on_click = self.screens[self.state]["on_click"]
+        hit = None
+        for name, center in self.screens[self.state]["visible"]:
+            if name in on_click and self._hit(name, center, x, y):
+                hit = name
+                break
+        if hit is None and "*" in on_click:
+            hit = "*"
+        self.clicks.append((now, x, y, hit))
+
+        # 画面切换过程中的重复点击不会重新计时
+        if hit and self._pending is None:
+            next_state, delay = on_click[hit]
+            self._pending = (now + delay, next_state)
+            if self.log:
+                self.log.debug(f"[模拟] {self.state} 点击 {hit} -> {next_state} ({delay} 秒后)")
@@ -0,0 +1,125 @@
+import threading
+import time
+import numpy as np
+
+
+class FrameGrabber:
+    """
+    后台截屏线程
+    持续截屏并转换为灰度图，写入预先分配的环形缓冲区，
+    匹配方直接读取最新一帧，不必等待截屏完成
+    """
+
+    def __init__(self, capture, slots=3, interval=0.1, log=None):
+        """
+        参数:
+            capture: 截屏函数 capture(dst=缓冲区) -> 灰度图，应把结果写入 dst
+            slots: 环形缓冲区的帧数
+            interval: 两次截屏之间的最短间隔（秒），用于在截屏频率和 CPU 占用之间取舍
+            log: 日志对象
+        """
+        self.capture = capture
+        self.slots = slots
+        self.interval = interval
+        self.log = log
+        self._ring = None  # 首帧确定尺寸后分配: (slots, h, w)
+        self._times = [0.0] * slots
+        self._seq = 0  # 已写入的帧数，最新帧位于 (_seq - 1) % slots
+        self._last_read_seq = 0
+        self.captured = 0
+        self.dropped = 0  # 被更新的帧取代、从未被读取的帧数
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """启动截屏线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        # 丢弃上次运行留下的帧：重复运行时（常驻模式、多实例调度）模拟器已重启，旧帧不能再用
+        with self._cond:
+            self._seq = 0
+            self._last_read_seq = 0
+            self._times = [0.0] * self.slots
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="frame-grabber", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止截屏线程"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def latest(self, newer_than=None, timeout=5.0):
+        """
+        获取最新一帧的副本
+
+        参数:
+            newer_than: 只接受在此时刻 (time.monotonic) 之后截取的帧，
+                        用于确保点击之后拿到的是新画面
+            timeout: 等待新帧的最长时间（秒）
+
+        返回:
+            (灰度图, 截取时刻)，超时返回 (None, None)
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._seq:
+                    index = (self._seq - 1) % self.slots
+                    captured_at = self._times[index]
+                    if newer_than is None or captured_at > newer_than:
+                        # 上次读取之后、本帧之前的帧都没有被读到
+                        self.dropped += max(self._seq - self._last_read_seq - 1, 0)
+                        self._last_read_seq = self._seq
+                        return self._ring[index].copy(), captured_at
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.running():
+                    return None, None
+                self._cond.wait(remaining)
+
+    def stats(self):
+        """
+        返回:
+            {"captured": 截屏总数, "dropped": 从未被读取的帧数, "age": 最新帧的年龄（秒）}
+        """
+        with self._cond:
+            age = None
+            if self._seq:
+                age = time.monotonic() - self._times[(self._seq - 1) % self.slots]
+            return {"captured": self.captured, "dropped": self.dropped, "age": age}
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self._capture_one()
+            except Exception as e:
+                if self.log:
+                    self.log.error(f"截屏线程异常: {e}")
+            self._stop.wait(max(self.interval - (time.monotonic() - started), 0))
+
+    def _capture_one(self):
+        index = self._seq % self.slots
+        # 以开始截屏的时刻作为帧时间，保证 newer_than 之后的帧确实是动作之后的画面
+        captured_at = time.monotonic()
+        if self._ring is None:
+            frame = self.capture()
+        else:
+            # 写入最旧的槽，最新帧所在的槽不会被写入，读取方拿到的始终是完整的帧
+            frame = self.capture(dst=self._ring[index])
+
+        with self._cond:
+            # 首帧或屏幕尺寸变化时重新分配环形缓冲区
+            if self._ring is None or frame.shape != self._ring.shape[1:]:
+                self._ring = np.empty((self.slots,) + frame.shape, dtype=frame.dtype)
+                self._ring[index] = frame
+            self._times[index] = captured_at
+            self._seq += 1
+            self.captured += 1
+            self._cond.notify_all()
@@ -1,21 +1,67 @@
-import pyautogui
+import cProfile
+import threading
 import time
 import os
 
-pyautogui.FAILSAFE = True
+from .frame_grabber import FrameGrabber
+from .input_backends import create_input_backend
+from .interrupt_monitor import InterruptMonitor
+from .poll_scheduler import PollScheduler
+from .tracer import Tracer
 
 class GameBot:
-    def __init__(self, confidence=0.8, assets_dir="assets", log=None):
+    def __init__(self, confidence=0.8, assets_dir="assets", log=None, matcher_options=None,
+                 scheduler_options=None, interrupt_options=None, capture_options=None,
+                 input_backend=None, input_options=None, clock=time.monotonic, sleep=time.sleep,
+                 tracer=None, profile=False):
+        """
+        参数:
+            matcher_options: 透传给 TemplateMatcher 的其他参数（来自配置文件 matcher 段）
+            scheduler_options: 每个步骤 PollScheduler 的默认参数（来自配置文件 scheduler 段），
+                               步骤自身的 timeout 等参数优先
+            interrupt_options: 中断检测配置（来自配置文件 interrupts 段）:
+                               background 是否使用后台监视器、interval 检测间隔、
+                               priorities 各中断目标的优先级（数值小的先处理）
+            capture_options: 截屏配置（来自配置文件 capture 段）:
+                             background 是否使用后台截屏线程、slots 环形缓冲区帧数、interval 截屏间隔
+            input_backend: 输入后端对象或名称（pyautogui / recording / adb），为None则使用 pyautogui
+            input_options: 按名称创建输入后端时传入的参数（如 adb 的 serial、adb_path），
+                           与截屏后端参数相同时两者共用同一个设备连接
+            clock: 单调时钟函数，步骤计时和轮询共用
+            sleep: 等待函数；与 clock 一起替换为虚拟时钟后，整个流程可以快于真实时间运行
+            tracer: 耗时追踪器，记录截屏、匹配、点击、等待和中断检测，span 带有当前步骤名
+            profile: 是否为每个步骤单独采集 cProfile 数据，结果保存在 step_profiles。
+                     cProfile 只记录主线程，开启后并行匹配、后台截屏和后台中断监视器都会关闭，
+                     全部工作在主线程串行执行，各步骤的数据才完整（耗时会比正常运行长）
+        """
         self.confidence = confidence
         self.assets_dir = assets_dir
         self.log = log
+        self.scheduler_options = scheduler_options or {}
+        self.clock = clock
+        self.sleep = sleep
+        self.tracer = tracer or Tracer(enabled=False)
+        self.profile = profile
+        self.step_profiles = []  # [(步骤序号, 步骤名, cProfile.Profile)]
+        if profile:
+            matcher_options = dict(matcher_options or {}, workers=None)
+            capture_options = dict(capture_options or {}, background=False)
+            interrupt_options = dict(interrupt_options or {}, background=False)
+            if log:
+                log.info("性能分析已开启：匹配、截屏和中断检测改为在主线程串行执行")
+        if input_backend is None or isinstance(input_backend, str):
+            input_backend = create_input_backend(input_backend or "pyautogui", log=log,
+                                                 **(input_options or {}))
+        self.input_backend = input_backend
 
         # 导入 TemplateMatcher
         from .template_matcher import TemplateMatcher
         self.matcher = TemplateMatcher(
             assets_dir=assets_dir,
             confidence=confidence,
-            log=log
+            log=log,
+            tracer=self.tracer,
+            **(matcher_options or {})
         )
 
         # 定义逻辑目标名称（对应文件夹名）
@@ -31,77 +77,164 @@ class GameBot:
         self.TARGET_DOWNLOAD = "download_resources"
         self.TARGET_UPDATE = "update_needed"
 
+        # 全局中断定义：目标、优先级、点击偏移、日志
+        interrupt_options = interrupt_options or {}
+        priorities = interrupt_options.get("priorities", {})
+        self.INTERRUPTS = sorted([
+            {"target": self.TARGET_OFFLINE, "priority": priorities.get(self.TARGET_OFFLINE, 0),
+             "offset": (0, 0), "message": ">>> 监测到断线重试，正在点击..."},
+            {"target": self.TARGET_DOWNLOAD, "priority": priorities.get(self.TARGET_DOWNLOAD, 1),
+             "offset": (0, 0), "message": ">>> 监测到资源下载，正在点击..."},
+            {"target": self.TARGET_UPDATE, "priority": priorities.get(self.TARGET_UPDATE, 2),
+             "offset": (0, 300), "message": ">>> 监测到更新弹窗，正在消除..."},
+        ], key=lambda interrupt: interrupt["priority"])
+        self.INTERRUPT_TARGETS = [interrupt["target"] for interrupt in self.INTERRUPTS]
+
+        # 后台截屏线程：匹配时直接取环形缓冲区中的最新帧
+        capture_options = capture_options or {}
+        self._last_click_at = 0.0
+        self.grabber = None
+        if capture_options.get("background"):
+            self.grabber = FrameGrabber(
+                capture=self.matcher.capture_frame,
+                slots=capture_options.get("slots", 3),
+                interval=capture_options.get("interval", 0.1),
+                log=log
+            )
+
+        # 后台中断监视器：与主流程共用动作锁，主流程不再每轮匹配中断目标
+        self._action_lock = threading.RLock()
+        self.monitor = None
+        if interrupt_options.get("background"):
+            self.monitor = InterruptMonitor(
+                check=self.check_interrupts,
+                capture=self.grab_frame,
+                interval=interrupt_options.get("interval", 1.5),
+                action_lock=self._action_lock,
+                log=log
+            )
+
     def _click_location(self, x, y):
-        pyautogui.click(x, y)
+        with self.tracer.span("click", x=x, y=y):
+            self.input_backend.click(x, y)
+        # 点击后画面即将变化，之前缓存的匹配结果作废
+        self.matcher.invalidate_cache()
+        # 与截屏线程的帧时间比较，始终使用真实时钟
+        self._last_click_at = time.monotonic()
         if self.log:
             self.log.debug(f"点击坐标: ({x}, {y})")
 
-    def check_interrupts(self):
-        """全局中断检测，返回 True 表示已处理中断"""
-        # 检测断线重连
-        pos = self.matcher.find_target(self.TARGET_OFFLINE)
-        if pos:
-            if self.log:
-                self.log.info(">>> 监测到断线重试，正在点击...")
-            self._click_location(pos[0], pos[1])
-            time.sleep(1)
-            return True
-
-        # 检测资源下载
-        pos = self.matcher.find_target(self.TARGET_DOWNLOAD)
-        if pos:
-            if self.log:
-                self.log.info(">>> 监测到资源下载，正在点击...")
-            self._click_location(pos[0], pos[1])
-            time.sleep(1)
-            return True
-
-        # 检测更新弹窗
-        pos = self.matcher.find_target(self.TARGET_UPDATE)
-        if pos:
-            if self.log:
-                self.log.info(">>> 监测到更新弹窗，正在消除...")
-            x, y = pos
-            self._click_location(x, y + 300)
-            time.sleep(1)
-            return True
+    def _wait(self, seconds, reason):
+        """等待并记录 span，reason 标明等待的来源（poll / post_wait 等）"""
+        with self.tracer.span("sleep", reason=reason, seconds=round(seconds, 3)):
+            self.sleep(seconds)
 
-        return False
+    def grab_frame(self):
+        """
+        获取用于匹配的灰度帧
+        截屏线程运行时取其最新帧（保证是最后一次点击之后截取的），否则直接截屏
+        """
+        if self.grabber and self.grabber.running():
+            with self.tracer.span("frame_wait"):
+                frame, _ = self.grabber.latest(newer_than=self._last_click_at)
+            if frame is not None:
+                return frame
+        return self.matcher.capture_frame()
+
+    def check_interrupts(self, frame=None, hits=None):
+        """全局中断检测，返回 True 表示已处理中断
+
+        参数:
+            frame: 本轮共用的灰度帧，为None则由匹配器自动截屏
+            hits: 已在本帧上批量匹配得到的结果 {目标名: 坐标}，为None则现场匹配
+        """
+        with self.tracer.span("interrupts"):
+            if hits is None:
+                hits = self.matcher.find_targets(self.INTERRUPT_TARGETS, frame)
+
+            # 按优先级依次检查，只处理最优先的一个
+            for interrupt in self.INTERRUPTS:
+                pos = hits.get(interrupt["target"])
+                if pos:
+                    if self.log:
+                        self.log.info(interrupt["message"])
+                    off_x, off_y = interrupt["offset"]
+                    self._click_location(pos[0] + off_x, pos[1] + off_y)
+                    self._wait(1, "interrupt")
+                    return True
+
+            return False
 
     def execute_step(self, success_target, action_target=None, action_index=0,
                      click_offset=None, success_check="exists", action_from_bottom=False,
-                     post_wait=2, skip_post_wait=None):
+                     post_wait=2, skip_post_wait=None, **scheduler_overrides):
         """通用原子操作
 
         参数:
             post_wait: 阶段完成后等待的秒数（默认2秒）
             skip_post_wait: 如果未执行点击动作就直接进入下一步时的等待秒数
+            scheduler_overrides: 本步骤的轮询参数（timeout、max_actions、max_interval 等），
+                                 覆盖 scheduler_options 中的默认值
+
+        返回:
+            bool: 成功条件满足返回 True；超时或动作次数用尽返回 False
         """
         if self.log:
             self.log.info(f"--- 阶段开始: 等待 {success_target} ---")
 
+        # 支持单个目标或目标列表
+        targets = success_target if isinstance(success_target, list) else [success_target]
+
+        # 每轮批量匹配的目标：中断 + 成功条件 + 动作目标（从下往上点击需要全部匹配点，单独处理）
+        # 后台监视器运行时中断由它负责，主流程只匹配自己的目标；
+        # 但"消失"条件仍需匹配中断目标：弹窗遮住目标时目标看起来也消失了
+        monitor_active = self.monitor is not None and self.monitor.running()
+        watch_interrupts = not monitor_active or success_check != "exists"
+        batch_targets = self.INTERRUPT_TARGETS + targets if watch_interrupts else targets
+        if action_target and not action_from_bottom:
+            batch_targets = batch_targets + [action_target]
+
+        scheduler = PollScheduler(**{**self.scheduler_options, **scheduler_overrides},
+                                  clock=self.clock, sleep=lambda seconds: self._wait(seconds, "poll"))
+
         loop_count = 0
         action_performed = False
         while True:
             loop_count += 1
+            acted = False
+
+            # 每轮只截一次屏，中断检测、成功检测和动作查找共用同一帧
+            frame = self.grab_frame()
+            if monitor_active:
+                self.monitor.publish(frame)
+            with self.tracer.span("find_targets", targets=len(batch_targets)):
+                hits = self.matcher.find_targets(batch_targets, frame)
+
+            if not monitor_active and self.check_interrupts(frame, hits):
+                if self._step_failed(scheduler, success_target):
+                    return False
+                continue
 
-            if self.check_interrupts():
+            if monitor_active and watch_interrupts and any(hits[t] is not None for t in self.INTERRUPT_TARGETS):
+                # 弹窗仍在画面上，等监视器处理完再重新检测，不据此判断目标已消失
+                if self._step_failed(scheduler, success_target):
+                    return False
+                scheduler.on_idle()
+                scheduler.wait()
                 continue
 
             # 检查成功条件
-            # 支持单个目标或目标列表
-            targets = success_target if isinstance(success_target, list) else [success_target]
             found_break = False
 
             for target in targets:
                 if success_check == "exists":
-                    if self.matcher.target_exists(target):
+                    if hits[target] is not None:
                         if self.log:
                             self.log.info(f"*** 成功检测到 {target} ***")
                         found_break = True
                         break
                 else:
-                    if not self.matcher.target_exists(target):
+                    if hits[target] is None:
                         if self.log:
                             self.log.info(f"*** {target} 已消失 ***")
                         found_break = True
@@ -110,46 +243,61 @@ class GameBot:
             if found_break:
                 break
 
-            # 执行动作
-            if action_target:
-                if action_from_bottom:
-                    all_matches = self.matcher.find_all_targets(action_target)
-                    if all_matches:
-                        actual_index = -(action_index + 1)
-                        if len(all_matches) > action_index:
-                            target = all_matches[actual_index]
-                            x, y = target
+            if self._step_failed(scheduler, success_target):
+                return False
+
+            # 上次点击后界面可能仍在切换，冷却期间保持快速轮询，但不重复点击
+            cooling = action_target and not scheduler.can_act()
+
+            # 执行动作（持有动作锁，避免与中断监视器的点击交错）
+            with self._action_lock:
+                if self.monitor and self.monitor.take_handled():
+                    # 中断刚被处理（处理时已等待），当前帧已过时，立即重新检测
+                    continue
+                if action_target and not cooling:
+                    if action_from_bottom:
+                        all_matches = self.matcher.find_all_targets(action_target, frame)
+                        if all_matches:
+                            actual_index = -(action_index + 1)
+                            if len(all_matches) > action_index:
+                                target = all_matches[actual_index]
+                                x, y = target
+
+                                if self.log:
+                                    self.log.info(f"点击 {action_target} (从下往上第 {action_index + 1} 个)")
+
+                                self._click_location(x, y)
+                                acted = True
+
+                                if click_offset:
+                                    self._wait(0.2, "click_offset")
+                                    off_x, off_y = click_offset
+                                    self._click_location(x + off_x, y + off_y)
+                    else:
+                        pos = hits[action_target]
+                        if pos:
+                            x, y = pos
 
                             if self.log:
-                                self.log.info(f"点击 {action_target} (从下往上第 {action_index + 1} 个)")
+                                self.log.info(f"点击 {action_target}")
 
                             self._click_location(x, y)
-                            action_performed = True
+                            acted = True
 
                             if click_offset:
-                                time.sleep(0.2)
+                                self._wait(0.2, "click_offset")
                                 off_x, off_y = click_offset
                                 self._click_location(x + off_x, y + off_y)
-                else:
-                    pos = self.matcher.find_target(action_target)
-                    if pos:
-                        x, y = pos
+                        else:
+                            if self.log and loop_count % 5 == 0:
+                                self.log.info(f"等待中... 未找到 {action_target}")
 
-                        if self.log:
-                            self.log.info(f"点击 {action_target}")
-
-                        self._click_location(x, y)
-                        action_performed = True
-
-                        if click_offset:
-                            time.sleep(0.2)
-                            off_x, off_y = click_offset
-                            self._click_location(x + off_x, y + off_y)
-                    else:
-                        if self.log and loop_count % 5 == 0:
-                            self.log.info(f"等待中... 未找到 {action_target}")
-
-            time.sleep(0.5)
+            if acted:
+                action_performed = True
+                scheduler.on_action()
+            elif not cooling:
+                scheduler.on_idle()
+            scheduler.wait()
 
         # 确定最终等待时间
         wait_time = post_wait
@@ -160,9 +308,86 @@ class GameBot:
 
         if self.log:
             self.log.info(f"阶段完成，等待 {wait_time} 秒...")
-        time.sleep(wait_time)
+        self._wait(wait_time, "post_wait")
         return True
 
+    def _step_failed(self, scheduler, success_target):
+        """步骤超时或动作次数用尽时记录原因并返回 True"""
+        reason = scheduler.failure_reason()
+        if reason and self.log:
+            self.log.error(f"等待 {success_target} 失败: {reason}，已用时 {scheduler.elapsed():.1f} 秒")
+        return reason is not None
+
+    def build_steps(self):
+        """
+        声明式步骤图：步骤按顺序执行，每个步骤包含
+            name: 步骤名称
+            success: 成功条件目标（单个或列表，列表中任一满足即完成，用于流程中途跳步）
+            action: 需要点击的目标
+            resume_on: 画面上出现这些目标时，说明流程正处于本步骤，可从这里直接开始；
+                       为None表示该步骤无法从画面判断（如 IT_float 常驻），不作为恢复入口
+            options: 传给 execute_step 的其他参数
+        """
+        return [
+            {"name": "点击IT图标", "success": self.TARGET_IT_FLOAT, "action": self.TARGET_IT,
+             "resume_on": None,
+             # 模拟器冷启动较慢，放宽超时并降低轮询频率
+             "options": {"timeout": 180, "max_interval": 2}},
+            {"name": "点击DL_entry",
+             "success": [self.TARGET_START, self.TARGET_USER, self.TARGET_SWITCH, self.TARGET_LOGIN],
+             "action": self.TARGET_DL_ENTRY,
+             "resume_on": [self.TARGET_DL_ENTRY],
+             "options": {"skip_post_wait": 1}},
+            {"name": "点击start",
+             "success": [self.TARGET_USER, self.TARGET_SWITCH, self.TARGET_LOGIN],
+             "action": self.TARGET_START,
+             "resume_on": [self.TARGET_START],
+             "options": {"skip_post_wait": 1}},
+            {"name": "点击user",
+             "success": [self.TARGET_SWITCH, self.TARGET_LOGIN],
+             "action": self.TARGET_USER,
+             "resume_on": [self.TARGET_USER],
+             "options": {"post_wait": 4, "skip_post_wait": 1}},
+            {"name": "点击switch_account", "success": self.TARGET_LOGIN, "action": self.TARGET_SWITCH,
+             "resume_on": [self.TARGET_SWITCH],
+             "options": {"post_wait": 3, "skip_post_wait": 1}},
+            {"name": "点击最下面login", "success": self.TARGET_LOGIN, "action": self.TARGET_LOGIN,
+             "resume_on": [self.TARGET_LOGIN],
+             "options": {"action_index": 0, "action_from_bottom": True, "success_check": "disappear",
+                         "post_wait": 5}},
+            # 登录之后的步骤不作为恢复入口：continue 也可能是上一次未完成流程的残留画面，
+            # 从这里开始会跳过账号切换本身
+            {"name": "点击IT_float偏移", "success": self.TARGET_CONTINUE, "action": self.TARGET_IT_FLOAT,
+             "resume_on": None,
+             "options": {"click_offset": (-280, 0), "post_wait": 2}},
+            {"name": "点击continue直到消失", "success": self.TARGET_CONTINUE, "action": self.TARGET_CONTINUE,
+             "resume_on": None,
+             "options": {"success_check": "disappear"}},
+        ]
+
+    def classify_state(self, steps, frame=None):
+        """
+        识别当前画面处于哪个步骤：一次性匹配所有步骤的恢复入口目标，
+        取画面上可见的最靠后的步骤
+
+        参数:
+            steps: build_steps() 返回的步骤列表
+            frame: 灰度帧，为None则自动截屏
+
+        返回:
+            int: 应开始执行的步骤下标（无法识别时为 0）
+        """
+        markers = [t for step in steps for t in (step["resume_on"] or [])]
+        if not markers:
+            return 0
+
+        hits = self.matcher.find_targets(markers, frame)
+        for index in range(len(steps) - 1, 0, -1):
+            resume_on = steps[index]["resume_on"]
+            if resume_on and any(hits[t] is not None for t in resume_on):
+                return index
+        return 0
+
     def run(self):
         """主业务流程"""
 
@@ -171,55 +396,65 @@ class GameBot:
             self.log.info("开始游戏自动化流程")
             self.log.info("=" * 50)
 
-        steps = [
-            ("点击IT图标", self.TARGET_IT_FLOAT, self.TARGET_IT, {}),
-            ("点击DL_entry", 
-             [self.TARGET_START, self.TARGET_USER, self.TARGET_SWITCH, self.TARGET_LOGIN], 
-             self.TARGET_DL_ENTRY, {"skip_post_wait": 1}),
-            ("点击start", 
-             [self.TARGET_USER, self.TARGET_SWITCH, self.TARGET_LOGIN], 
-             self.TARGET_START, {"skip_post_wait": 1}),
-            ("点击user", 
-             [self.TARGET_SWITCH, self.TARGET_LOGIN], 
-             self.TARGET_USER, {"post_wait": 4, "skip_post_wait": 1}),
-            ("点击switch_account", self.TARGET_LOGIN, self.TARGET_SWITCH, {"post_wait": 3, "skip_post_wait": 1}),
-            ("点击最下面login", self.TARGET_LOGIN, self.TARGET_LOGIN, {
-                "action_index": 0, "action_from_bottom": True, "success_check": "disappear",
-                "post_wait": 5
-            }),
-            ("点击IT_float偏移", self.TARGET_CONTINUE, self.TARGET_IT_FLOAT, {
-                "click_offset": (-280, 0), "post_wait": 2
-            }),
-            ("点击continue直到消失", self.TARGET_CONTINUE, self.TARGET_CONTINUE, {
-                "success_check": "disappear"
-            }),
-        ]
+        steps = self.build_steps()
 
-        completed_steps = 0
-        failed_step = None
+        if self.grabber:
+            self.grabber.start()
+        if self.monitor:
+            self.monitor.start()
 
-        for i, (step_name, success_target, action_target, kwargs) in enumerate(steps, 1):
-            if self.log:
-                self.log.info(f"\n[步骤 {i}/{len(steps)}] {step_name}")
-
-            try:
-                success = self.execute_step(
-                    success_target=success_target,
-                    action_target=action_target,
-                    **kwargs
-                )
-                if success:
-                    completed_steps += 1
-                else:
+        try:
+            # 先识别画面所处的步骤，跳过已经完成的部分
+            with self.tracer.span("classify"):
+                start_index = self.classify_state(steps, self.grab_frame())
+            if start_index and self.log:
+                self.log.info(f"识别到当前画面处于步骤 {start_index + 1}: {steps[start_index]['name']}，跳过前 {start_index} 步")
+
+            completed_steps = start_index
+            failed_step = None
+
+            for i, step in enumerate(steps[start_index:], start_index + 1):
+                step_name = step["name"]
+                if self.log:
+                    self.log.info(f"\n[步骤 {i}/{len(steps)}] {step_name}")
+
+                self.tracer.set_tags(step=step_name)
+                profiler = cProfile.Profile() if self.profile else None
+                try:
+                    if profiler:
+                        profiler.enable()
+                    with self.tracer.span("step"):
+                        success = self.execute_step(
+                            success_target=step["success"],
+                            action_target=step["action"],
+                            **step["options"]
+                        )
+                    if success:
+                        completed_steps += 1
+                    else:
+                        failed_step = step_name
+                        if self.log:
+                            self.log.error(f"步骤失败: {step_name}")
+                        break
+                except Exception as e:
                     failed_step = step_name
                     if self.log:
-                        self.log.error(f"步骤失败: {step_name}")
+                        self.log.error(f"步骤异常: {step_name} - {e}")
                     break
-            except Exception as e:
-                failed_step = step_name
+                finally:
+                    if profiler:
+                        profiler.disable()
+                        self.step_profiles.append((i, step_name, profiler))
+                    self.tracer.set_tags(step=None)
+        finally:
+            self.matcher.save_template_stats()
+            if self.monitor:
+                self.monitor.stop()
+            if self.grabber:
+                self.grabber.stop()
                 if self.log:
-                    self.log.error(f"步骤异常: {step_name} - {e}")
-                break
+                    stats = self.grabber.stats()
+                    self.log.info(f"截屏统计: 共 {stats['captured']} 帧，未被使用 {stats['dropped']} 帧")
 
         if self.log:
             self.log.info("=" * 50)
@@ -233,5 +468,6 @@ class GameBot:
             "success": failed_step is None,
             "completed_steps": completed_steps,
             "total_steps": len(steps),
+            "skipped_steps": start_index,
             "failed_step": failed_step
         }
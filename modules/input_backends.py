@@ -0,0 +1,57 @@
+from .adb_device import get_device
+
+# 输入后端：统一提供 click(x, y)
+# 与截屏后端对应，便于在模拟器、回放或无桌面环境下替换真实的鼠标操作
+
+
+class PyAutoGUIInput:
+    """基于 pyautogui 的鼠标点击（原有方式）"""
+
+    def __init__(self, failsafe=True):
+        """
+        参数:
+            failsafe: 鼠标移到屏幕角落时中止脚本
+        """
+        # 首次点击时才导入，无桌面环境下也能创建 GameBot
+        self.failsafe = failsafe
+        self._pyautogui = None
+
+    def click(self, x, y):
+        if self._pyautogui is None:
+            import pyautogui
+            pyautogui.FAILSAFE = self.failsafe
+            self._pyautogui = pyautogui
+        self._pyautogui.click(x, y)
+
+
+class RecordingInput:
+    """只记录点击坐标、不操作鼠标，用于测试和演练"""
+
+    def __init__(self):
+        self.clicks = []
+
+    def click(self, x, y):
+        self.clicks.append((x, y))
+
+
+BACKENDS = {
+    "pyautogui": PyAutoGUIInput,
+    "recording": RecordingInput,
+    "adb": get_device,
+}
+
+
+def create_input_backend(name="pyautogui", log=None, **options):
+    """
+    按名称创建输入后端
+
+    参数:
+        name: 后端名称（pyautogui / recording / adb）
+        log: 日志对象
+        options: 传给后端构造函数的参数
+    """
+    if name not in BACKENDS:
+        if log:
+            log.warning(f"未知的输入后端 {name}，使用 pyautogui")
+        name = "pyautogui"
+    return BACKENDS[name](**options)
@@ -0,0 +1,77 @@
+import threading
+import time
+
+
+class InterruptMonitor:
+    """
+    后台中断监视器
+    按独立的节奏检测断线、下载、更新等低频弹窗，主流程只需匹配自己的目标。
+    处理中断时持有动作锁，主流程的点击会暂停；处理完成后置位标志，
+    主流程据此丢弃旧帧并重新检测
+    """
+
+    def __init__(self, check, capture, interval=1.5, action_lock=None, log=None):
+        """
+        参数:
+            check: 中断处理函数 check(frame) -> bool，返回 True 表示已处理中断
+            capture: 截屏函数，共享帧过旧时使用
+            interval: 检测间隔（秒）
+            action_lock: 与主流程共用的动作锁
+            log: 日志对象
+        """
+        self.check = check
+        self.capture = capture
+        self.interval = interval
+        self.action_lock = action_lock or threading.RLock()
+        self.log = log
+        self._latest = (None, 0.0)  # (最新帧, 发布时间)
+        self._handled = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def publish(self, frame):
+        """主流程发布最新截取的帧，监视器优先使用它而不是重新截屏"""
+        self._latest = (frame, time.monotonic())
+
+    def take_handled(self):
+        """
+        主流程查询自上次查询以来是否处理过中断（查询后清除标志）
+
+        返回:
+            bool: 处理过中断时主流程应丢弃当前帧重新检测
+        """
+        if self._handled.is_set():
+            self._handled.clear()
+            return True
+        return False
+
+    def start(self):
+        """启动后台线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="interrupt-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台线程"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 5)
+            self._thread = None
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                frame, published_at = self._latest
+                if frame is None or time.monotonic() - published_at > self.interval:
+                    frame = self.capture()
+                with self.action_lock:
+                    if self.check(frame):
+                        self._handled.set()
+            except Exception as e:
+                if self.log:
+                    self.log.error(f"中断监视器异常: {e}")
@@ -0,0 +1,209 @@
+import logging
+import queue
+import subprocess
+import threading
+import time
+
+# 多实例并行：每个工作线程绑定一个模拟器实例（独立的截屏区域或设备、独立的输入目标），
+# 从共享队列中领取账号切换任务，完成后汇总吞吐量
+
+
+class RegionCapture:
+    """把截屏限定在某个实例窗口的区域内，返回的坐标相对于该区域"""
+
+    def __init__(self, backend, region):
+        """
+        参数:
+            backend: 截屏后端
+            region: 实例窗口在屏幕上的区域 (left, top, width, height)
+        """
+        self.backend = backend
+        self.region = tuple(region)
+
+    def grab(self, region=None, dst=None):
+        left, top, width, height = self.region
+        if region:
+            # 匹配器传入的子区域相对于实例窗口
+            sub_left, sub_top, width, height = region
+            left, top = left + sub_left, top + sub_top
+        return self.backend.grab((left, top, width, height), dst)
+
+
+class OffsetInput:
+    """把相对于实例窗口的点击坐标换算为屏幕坐标；多个实例共用鼠标时用同一把锁串行点击"""
+
+    def __init__(self, backend, offset=(0, 0), lock=None):
+        """
+        参数:
+            backend: 输入后端
+            offset: 实例窗口左上角在屏幕上的坐标
+            lock: 共享的点击锁，为None则不加锁（如每个实例有独立的输入设备）
+        """
+        self.backend = backend
+        self.offset = offset
+        self.lock = lock
+
+    def click(self, x, y):
+        x, y = x + self.offset[0], y + self.offset[1]
+        if self.lock is None:
+            self.backend.click(x, y)
+            return
+        with self.lock:
+            self.backend.click(x, y)
+
+
+class LDConsoleEmulator:
+    """通过 ldconsole.exe 按序号控制雷电多开实例"""
+
+    def __init__(self, ldconsole_path, index, launch_timeout=60, poll_interval=0.5,
+                 runner=subprocess.run, log=None):
+        """
+        参数:
+            ldconsole_path: ldconsole.exe 路径（雷电模拟器安装目录下）
+            index: 多开实例序号
+            launch_timeout: 等待实例进入运行状态的超时（秒）
+            poll_interval: 查询运行状态的间隔（秒）
+            runner: 执行命令的函数，签名同 subprocess.run，便于替换为桩
+            log: 日志对象
+        """
+        self.ldconsole_path = ldconsole_path
+        self.index = index
+        self.launch_timeout = launch_timeout
+        self.poll_interval = poll_interval
+        self.runner = runner
+        self.log = log
+
+    def _run(self, *args):
+        return self.runner([self.ldconsole_path, *args, "--index", str(self.index)],
+                           capture_output=True, text=True, timeout=30)
+
+    def is_running(self):
+        result = self._run("isrunning")
+        return result.returncode == 0 and result.stdout.strip() == "running"
+
+    def restart(self):
+        """
+        重启实例并等待其进入运行状态
+
+        返回:
+            bool: 是否已运行
+        """
+        if self.log:
+            self.log.info(f"重启雷电实例 {self.index}")
+        self._run("quit")
+        self._run("launch")
+        deadline = time.monotonic() + self.launch_timeout
+        while time.monotonic() < deadline:
+            if self.is_running():
+                return True
+            time.sleep(self.poll_interval)
+        if self.log:
+            self.log.error(f"雷电实例 {self.index} 启动超时")
+        return False
+
+
+class _PrefixLog(logging.LoggerAdapter):
+    """在每条日志前加上工作线程名，区分各实例交错输出的日志"""
+
+    def process(self, msg, kwargs):
+        return f"[{self.extra['worker']}] {msg}", kwargs
+
+
+def prefixed_log(log, worker):
+    return _PrefixLog(log, {"worker": worker}) if log else None
+
+
+class Orchestrator:
+    """
+    多实例调度器
+    每个工作线程独占一个 GameBot 和对应的模拟器实例，从队列中领取任务直到队列为空
+    """
+
+    def __init__(self, workers, restart_each_job=True, log=None):
+        """
+        参数:
+            workers: 工作线程定义列表 [{"name": 名称, "bot": GameBot, "emulator": 实例控制对象或None}]，
+                     emulator 需提供 restart() -> bool
+            restart_each_job: 每个任务开始前是否重启该实例
+            log: 日志对象
+        """
+        self.workers = workers
+        self.restart_each_job = restart_each_job
+        self.log = log
+        self.results = []
+        self._results_lock = threading.Lock()
+
+    def _work(self, worker, jobs):
+        name = worker["name"]
+        while True:
+            try:
+                job = jobs.get_nowait()
+            except queue.Empty:
+                return
+            started = time.monotonic()
+            record = {"job": job, "worker": name, "success": False, "failed_step": None}
+            try:
+                emulator = worker.get("emulator")
+                if emulator and self.restart_each_job and not emulator.restart():
+                    record["failed_step"] = "模拟器重启"
+                else:
+                    result = worker["bot"].run()
+                    record["success"] = result["success"]
+                    record["failed_step"] = result["failed_step"]
+            except Exception as e:
+                record["failed_step"] = f"异常: {e}"
+                if self.log:
+                    self.log.error(f"[{name}] 任务 {job} 异常: {e}")
+            record["duration"] = time.monotonic() - started
+            with self._results_lock:
+                self.results.append(record)
+            if self.log:
+                state = "成功" if record["success"] else f"失败 ({record['failed_step']})"
+                self.log.info(f"[{name}] 任务 {job} {state}，用时 {record['duration']:.1f} 秒")
+
+    def run(self, jobs):
+        """
+        执行所有任务
+
+        参数:
+            jobs: 任务列表（任意可打印对象，如账号名）
+
+        返回:
+            汇总统计，见 summary()
+        """
+        job_queue = queue.Queue()
+        for job in jobs:
+            job_queue.put(job)
+
+        self.results = []
+        started = time.monotonic()
+        threads = [threading.Thread(target=self._work, args=(worker, job_queue),
+                                    name=f"bot-{worker['name']}", daemon=True)
+                   for worker in self.workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.summary(time.monotonic() - started)
+
+    def summary(self, elapsed):
+        """
+        返回:
+            {"jobs": 任务数, "succeeded": 成功数, "failed": 失败数, "elapsed": 总用时（秒）,
+             "throughput": 每分钟完成的成功任务数, "workers": {名称: {"jobs", "succeeded", "busy"}}}
+        """
+        workers = {worker["name"]: {"jobs": 0, "succeeded": 0, "busy": 0.0} for worker in self.workers}
+        for record in self.results:
+            stats = workers[record["worker"]]
+            stats["jobs"] += 1
+            stats["succeeded"] += record["success"]
+            stats["busy"] += record["duration"]
+        succeeded = sum(record["success"] for record in self.results)
+        return {
+            "jobs": len(self.results),
+            "succeeded": succeeded,
+            "failed": len(self.results) - succeeded,
+            "elapsed": elapsed,
+            "throughput": succeeded / elapsed * 60 if elapsed > 0 else 0.0,
+            "workers": workers,
+        }
@@ -0,0 +1,80 @@
+import time
+
+
+class PollScheduler:
+    """
+    轮询节奏调度器
+    点击后界面即将变化，用最短间隔快速轮询；画面长时间无进展时逐步退避到最长间隔。
+    同时负责单个步骤的超时和动作重试次数限制，避免卡死的画面让流程无限等待。
+    界面切换期间被点击的目标往往仍在画面上：快速轮询只用于尽早发现成功条件，
+    重复点击要间隔 reclick_interval，否则较慢的切换会很快耗尽动作次数
+    """
+
+    def __init__(self, min_interval=0.2, max_interval=1.0, backoff=1.5,
+                 timeout=None, max_actions=None, reclick_interval=2.0,
+                 clock=time.monotonic, sleep=time.sleep):
+        """
+        参数:
+            min_interval: 动作之后的轮询间隔（秒）
+            max_interval: 退避后的最长轮询间隔（秒）
+            backoff: 每轮无动作时间隔的放大倍数
+            timeout: 步骤超时（秒），为None则不限时
+            max_actions: 步骤内最多执行的动作次数，为None则不限次数
+            reclick_interval: 上次动作之后，至少间隔这么久（秒）才能再次执行动作
+            clock: 单调时钟函数
+            sleep: 等待函数
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_actions = max_actions
+        self.reclick_interval = reclick_interval
+        self.clock = clock
+        self.sleep = sleep
+        self.start()
+
+    def start(self):
+        """开始计时（新步骤开始时调用）"""
+        self.started_at = self.clock()
+        self.interval = self.min_interval
+        self.actions = 0
+        self.last_action_at = None
+
+    def elapsed(self):
+        """步骤已用时间（秒）"""
+        return self.clock() - self.started_at
+
+    def on_action(self):
+        """执行了点击等动作：计数并恢复快速轮询"""
+        self.actions += 1
+        self.interval = self.min_interval
+        self.last_action_at = self.clock()
+
+    def can_act(self):
+        """距上次动作是否已超过 reclick_interval；冷却期间只检测不点击"""
+        return self.last_action_at is None or self.clock() - self.last_action_at >= self.reclick_interval
+
+    def on_idle(self):
+        """本轮无动作：轮询间隔退避"""
+        self.interval = min(self.interval * self.backoff, self.max_interval)
+
+    def failure_reason(self):
+        """
+        检查步骤是否应当失败
+
+        返回:
+            失败原因字符串，未超出限制时返回 None
+        """
+        if self.timeout is not None and self.elapsed() >= self.timeout:
+            return f"超时 ({self.timeout} 秒)"
+        if self.max_actions is not None and self.actions >= self.max_actions:
+            return f"动作次数已达上限 ({self.max_actions} 次)"
+        return None
+
+    def wait(self):
+        """等待到下一次轮询，不会越过步骤截止时间"""
+        interval = self.interval
+        if self.timeout is not None:
+            interval = max(min(interval, self.timeout - self.elapsed()), 0)
+        self.sleep(interval)
@@ -0,0 +1,335 @@
+import os
+import shutil
+import subprocess
+import sys
+import time
+import cv2
+import numpy as np
+import psutil
+
+from .adb_device import get_device
+from .emulator_manager import PROCESS_NAME, get_running_process_path
+
+# 模拟器启动就绪检测：在开始模板匹配之前，依次等待各项探针通过，
+# 避免对黑屏或加载画面做整帧匹配。探针只需提供 name、available() 和 check()，可替换为本地桩；
+# fatal 为 True 的探针未通过时立即放弃等待（如模拟器进程已退出）
+
+
+class ProcessProbe:
+    """模拟器进程仍在运行"""
+
+    name = "进程"
+    fatal = True  # 进程已经退出，继续等待没有意义
+
+    def __init__(self, handle, process_name=PROCESS_NAME):
+        """
+        参数:
+            handle: restart_dnplayer 返回的 psutil.Process
+            process_name: 模拟器进程名；跟踪的进程退出后按名称查找，
+                          应对启动器拉起真正的模拟器进程后自行退出的情况
+        """
+        self.handle = handle
+        self.process_name = process_name
+
+    def available(self):
+        return self.handle is not None
+
+    @staticmethod
+    def _alive(proc):
+        try:
+            return proc.is_running() and proc.status() != psutil.STATUS_ZOMBIE
+        except psutil.NoSuchProcess:
+            return False
+
+    def check(self):
+        if self._alive(self.handle):
+            return True
+        if self.process_name:
+            _, proc = get_running_process_path(self.process_name)
+            if proc and self._alive(proc):
+                self.handle = proc
+                return True
+        return False
+
+
+def _visible_window_titles():
+    """枚举可见的顶层窗口标题（仅 Windows）"""
+    import ctypes
+    from ctypes import wintypes
+
+    user32 = ctypes.windll.user32
+    titles = []
+
+    @ctypes.WINFUNCTYPE(wintypes.BOOL, wintypes.HWND, wintypes.LPARAM)
+    def callback(hwnd, _):
+        if user32.IsWindowVisible(hwnd):
+            length = user32.GetWindowTextLengthW(hwnd)
+            if length:
+                buffer = ctypes.create_unicode_buffer(length + 1)
+                user32.GetWindowTextW(hwnd, buffer, length + 1)
+                titles.append(buffer.value)
+        return True
+
+    user32.EnumWindows(callback, 0)
+    return titles
+
+
+def _window_region(title):
+    """
+    查找标题包含 title 的可见窗口，返回其客户区在屏幕上的区域（仅 Windows）
+
+    返回:
+        (left, top, width, height)，找不到窗口或窗口已最小化时返回 None
+    """
+    import ctypes
+    from ctypes import wintypes
+
+    user32 = ctypes.windll.user32
+    found = []
+
+    @ctypes.WINFUNCTYPE(wintypes.BOOL, wintypes.HWND, wintypes.LPARAM)
+    def callback(hwnd, _):
+        if user32.IsWindowVisible(hwnd) and not user32.IsIconic(hwnd):
+            length = user32.GetWindowTextLengthW(hwnd)
+            if length:
+                buffer = ctypes.create_unicode_buffer(length + 1)
+                user32.GetWindowTextW(hwnd, buffer, length + 1)
+                if title in buffer.value:
+                    found.append(hwnd)
+                    return False
+        return True
+
+    user32.EnumWindows(callback, 0)
+    if not found:
+        return None
+    rect = wintypes.RECT()
+    user32.GetClientRect(found[0], ctypes.byref(rect))
+    origin = wintypes.POINT(0, 0)
+    user32.ClientToScreen(found[0], ctypes.byref(origin))
+    if rect.right <= 0 or rect.bottom <= 0:
+        return None
+    return origin.x, origin.y, rect.right, rect.bottom
+
+
+class WindowProbe:
+    """模拟器主窗口已出现"""
+
+    name = "窗口"
+
+    def __init__(self, title="雷电模拟器", list_titles=None):
+        """
+        参数:
+            title: 窗口标题中包含的文字
+            list_titles: 返回当前窗口标题列表的函数，默认使用 Windows API
+        """
+        self.title = title
+        self.list_titles = list_titles
+        if self.list_titles is None and sys.platform == "win32":
+            self.list_titles = _visible_window_titles
+
+    def available(self):
+        return self.list_titles is not None
+
+    def check(self):
+        return any(self.title in title for title in self.list_titles())
+
+
+class AdbBootProbe:
+    """通过 adb 读取 sys.boot_completed，安卓系统启动完成后为 1"""
+
+    name = "adb"
+
+    def __init__(self, adb_path="adb", serial=None, timeout=3, runner=subprocess.run):
+        """
+        参数:
+            adb_path: adb 可执行文件（雷电模拟器安装目录下自带 adb.exe）
+            serial: 设备序列号（如 emulator-5554），为None则使用默认设备
+            timeout: 单次 adb 调用的超时（秒）
+            runner: 执行命令的函数，签名同 subprocess.run，便于替换为桩
+        """
+        self.adb_path = adb_path
+        self.serial = serial
+        self.timeout = timeout
+        self.runner = runner
+
+    def available(self):
+        if self.runner is not subprocess.run:
+            return True
+        return os.path.exists(self.adb_path) or shutil.which(self.adb_path) is not None
+
+    def check(self):
+        command = [self.adb_path]
+        if self.serial:
+            command += ["-s", self.serial]
+        command += ["shell", "getprop", "sys.boot_completed"]
+        try:
+            result = self.runner(command, capture_output=True, text=True, timeout=self.timeout)
+        except (OSError, subprocess.SubprocessError):
+            return False
+        return result.returncode == 0 and result.stdout.strip() == "1"
+
+
+class FrameStabilityProbe:
+    """
+    画面稳定：连续若干次截屏几乎没有变化，且不是纯色（黑屏、白屏）
+    加载动画期间画面持续变化，不会通过。
+    只应检测模拟器画面（窗口区域或设备截屏）：整个桌面基本静止且不是纯色，
+    模拟器窗口黑屏或只有一个小加载图标时也会被判为稳定
+    """
+
+    name = "画面稳定"
+
+    def __init__(self, capture, region=None, samples=3, threshold=2.0, min_std=8.0, cell=16):
+        """
+        参数:
+            capture: 截屏函数 capture(region=None)，返回灰度图
+            region: 只检测该区域 (left, top, width, height)，也可以是返回区域的函数
+                    （如按标题查找模拟器窗口）；函数返回 None 时视为未就绪
+            samples: 需要连续稳定的帧数
+            threshold: 相邻两帧缩略图的平均灰度差低于该值视为稳定
+            min_std: 画面灰度标准差低于该值视为纯色画面
+            cell: 缩略图格子边长（像素）
+        """
+        self.capture = capture
+        self.region = region
+        self.samples = samples
+        self.threshold = threshold
+        self.min_std = min_std
+        self.cell = cell
+        self._previous = None
+        self._stable = 0
+
+    def available(self):
+        return self.capture is not None
+
+    def check(self):
+        region = self.region() if callable(self.region) else self.region
+        if region is None and self.region is not None:
+            self._previous, self._stable = None, 0
+            return False
+        frame = self.capture(region) if region else self.capture()
+        h, w = frame.shape[:2]
+        thumb = cv2.resize(frame, (max(w // self.cell, 1), max(h // self.cell, 1)),
+                           interpolation=cv2.INTER_AREA)
+        previous, self._previous = self._previous, thumb
+        if float(np.std(thumb)) < self.min_std:
+            self._stable = 0
+            return False
+        if previous is None or previous.shape != thumb.shape:
+            self._stable = 1
+        elif float(cv2.absdiff(previous, thumb).mean()) < self.threshold:
+            self._stable += 1
+        else:
+            self._stable = 1
+        return self._stable >= self.samples
+
+
+class ReadinessGate:
+    """
+    按顺序等待各探针通过，前一个探针通过后才检测下一个
+    （进程 -> 窗口 -> 安卓系统 -> 画面），开销小的探针在前
+    """
+
+    def __init__(self, probes, timeout=120, interval=0.5, clock=time.monotonic, sleep=time.sleep, log=None):
+        """
+        参数:
+            probes: 探针列表，当前环境不可用的探针（available() 为 False）会被跳过
+            timeout: 总超时（秒）
+            interval: 探针未通过时的重试间隔（秒）
+            clock: 单调时钟函数
+            sleep: 等待函数
+            log: 日志对象
+        """
+        self.probes = probes
+        self.timeout = timeout
+        self.interval = interval
+        self.clock = clock
+        self.sleep = sleep
+        self.log = log
+
+    def wait(self):
+        """
+        返回:
+            bool: 全部可用探针都已通过返回 True；超时或进程退出返回 False
+        """
+        started = self.clock()
+        deadline = started + self.timeout
+        for probe in self.probes:
+            if not probe.available():
+                if self.log:
+                    self.log.info(f"就绪检测: 跳过不可用的探针 [{probe.name}]")
+                continue
+            while True:
+                try:
+                    passed = probe.check()
+                except Exception as e:
+                    if self.log:
+                        self.log.debug(f"就绪检测 [{probe.name}] 出错: {e}")
+                    passed = False
+                if passed:
+                    if self.log:
+                        self.log.info(f"就绪检测: [{probe.name}] 通过 ({self.clock() - started:.1f} 秒)")
+                    break
+                if getattr(probe, "fatal", False):
+                    if self.log:
+                        self.log.error(f"就绪检测: [{probe.name}] 未通过且无法恢复，停止等待")
+                    return False
+                if self.clock() >= deadline:
+                    if self.log:
+                        self.log.warning(f"就绪检测: 等待 [{probe.name}] 超时 ({self.timeout} 秒)")
+                    return False
+                self.sleep(self.interval)
+        return True
+
+
+PROBES = {
+    "process": ProcessProbe,
+    "window": WindowProbe,
+    "adb": AdbBootProbe,
+    "frame_stable": FrameStabilityProbe,
+}
+
+
+def create_gate(options=None, capture=None, handle=None, log=None):
+    """
+    按配置创建就绪检测（来自配置文件 readiness 段）
+
+    参数:
+        options: {"timeout": 秒, "interval": 秒, "probes": [{"type": "process"}, {"type": "adb", ...}, ...]}
+                 frame_stable 探针可指定检测范围: "region": [left, top, width, height]，
+                 "window": 窗口标题（仅 Windows，每次检测时查找窗口区域），
+                 或 "serial" / "adb_path"（直接读取设备帧缓冲）
+        capture: 截屏函数，供 frame_stable 探针使用
+        handle: 模拟器进程 (psutil.Process)，供 process 探针使用
+        log: 日志对象
+
+    返回:
+        ReadinessGate
+    """
+    options = options or {}
+    probes = []
+    for spec in options.get("probes", [{"type": "process"}, {"type": "frame_stable"}]):
+        spec = dict(spec)
+        kind = spec.pop("type")
+        if kind not in PROBES:
+            if log:
+                log.warning(f"未知的就绪探针 {kind}，已忽略")
+            continue
+        if kind == "process":
+            spec["handle"] = handle
+        elif kind == "frame_stable":
+            spec["capture"] = capture
+            window = spec.pop("window", None)
+            if "serial" in spec or "adb_path" in spec:
+                # 设备截屏只包含模拟器画面
+                spec["capture"] = get_device(spec.pop("serial", None), spec.pop("adb_path", "adb")).grab
+            elif window and "region" not in spec:
+                if sys.platform != "win32":
+                    if log:
+                        log.warning(f"无法在当前系统查找窗口 {window}，已忽略 frame_stable 探针")
+                    continue
+                spec["region"] = lambda title=window: _window_region(title)
+            elif "region" in spec:
+                spec["region"] = tuple(spec["region"])
+        probes.append(PROBES[kind](**spec))
+    return ReadinessGate(probes, timeout=options.get("timeout", 120), interval=options.get("interval", 0.5), log=log)
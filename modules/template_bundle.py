@@ -0,0 +1,143 @@
+import json
+import os
+import numpy as np
+
+# 样板包文件格式:
+#   8 字节魔数 | 8 字节头部长度 (little-endian) | JSON 头部 | 按 ALIGN 对齐的灰度图数据区
+# 头部记录源图片哈希和构建参数，任一变化即视为失效，需要重新构建
+MAGIC = b"TMPLBND1"
+ALIGN = 64
+VERSION = 2
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def write_bundle(path, sources, params, templates, variant_scales, small_templates, template_moments,
+                 variant_names=None):
+    """
+    将已加载的样板编译为一个可内存映射的样板包
+
+    参数:
+        path: 样板包文件路径
+        sources: 源图片内容哈希 {"目标/文件名": sha1}
+        params: 影响构建结果的参数（缩放比例、金字塔比例等）
+        templates: {逻辑名: [灰度图, ...]}
+        variant_scales: {逻辑名: [缩放比例, ...]}
+        small_templates: {逻辑名: [缩小图 或 None, ...]}
+        template_moments: {逻辑名: [(灰度均值, 标准差), ...]}
+        variant_names: {逻辑名: [样板名（文件名@缩放比例）, ...]}，用于按样板记录命中统计
+    """
+    entries = []
+    arrays = []
+    offset = 0
+    for name, images in templates.items():
+        smalls = small_templates.get(name) or [None] * len(images)
+        names = (variant_names or {}).get(name) or [None] * len(images)
+        for index, (img, small) in enumerate(zip(images, smalls)):
+            mean, std = template_moments[name][index]
+            entry = {
+                "target": name,
+                "index": index,
+                "name": names[index],
+                "scale": variant_scales[name][index],
+                "mean": mean,
+                "std": std,
+                "offset": offset,
+                "shape": list(img.shape[:2]),
+                "small_offset": None,
+                "small_shape": None,
+            }
+            arrays.append((offset, img))
+            offset = _align(offset + img.size)
+            if small is not None:
+                entry["small_offset"] = offset
+                entry["small_shape"] = list(small.shape[:2])
+                arrays.append((offset, small))
+                offset = _align(offset + small.size)
+            entries.append(entry)
+
+    header = json.dumps({
+        "version": VERSION,
+        "sources": sources,
+        "params": params,
+        "targets": list(templates),
+        "entries": entries,
+    }, ensure_ascii=False).encode("utf-8")
+    data_start = _align(len(MAGIC) + 8 + len(header))
+
+    # 先写临时文件再替换，避免其他进程读到半截的样板包
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        for pos, img in arrays:
+            f.seek(data_start + pos)
+            f.write(np.ascontiguousarray(img).tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+
+
+def load_bundle(path, sources, params):
+    """
+    以内存映射方式零拷贝加载样板包
+
+    参数:
+        path: 样板包文件路径
+        sources: 当前源图片内容哈希 {"目标/文件名": sha1}
+        params: 当前构建参数
+
+    返回:
+        {"templates", "variant_scales", "small_templates", "template_moments", "variant_names"}，
+        文件不存在或已失效时返回 None
+    """
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            return None
+        header_len = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_len).decode("utf-8"))
+
+    if header.get("version") != VERSION or header.get("sources") != sources or header.get("params") != params:
+        return None
+
+    data_start = _align(len(MAGIC) + 8 + header_len)
+    mm = np.memmap(path, dtype=np.uint8, mode="r")
+
+    def view(offset, shape):
+        start = data_start + offset
+        return mm[start:start + shape[0] * shape[1]].reshape(shape)
+
+    result = {
+        "templates": {name: [] for name in header["targets"]},
+        "variant_scales": {name: [] for name in header["targets"]},
+        "small_templates": {name: [] for name in header["targets"]},
+        "template_moments": {name: [] for name in header["targets"]},
+        "variant_names": {name: [] for name in header["targets"]},
+    }
+    for entry in header["entries"]:
+        name = entry["target"]
+        result["templates"][name].append(view(entry["offset"], entry["shape"]))
+        result["variant_scales"][name].append(entry["scale"])
+        result["small_templates"][name].append(
+            view(entry["small_offset"], entry["small_shape"]) if entry["small_offset"] is not None else None)
+        result["template_moments"][name].append((entry["mean"], entry["std"]))
+        result["variant_names"][name].append(entry["name"])
+    return result
+
+
+if __name__ == "__main__":
+    # 手动预编译样板包: python -m modules.template_bundle
+    from .template_matcher import TemplateMatcher
+
+    with open("config.json", "r", encoding="utf-8") as f:
+        matcher_options = json.load(f).get("matcher", {})
+    if not matcher_options.get("bundle_file"):
+        print("config.json 的 matcher 段未配置 bundle_file")
+    else:
+        matcher = TemplateMatcher(assets_dir="assets", **matcher_options)
+        print(f"样板包已就绪: {matcher.bundle_file} ({sum(map(len, matcher.templates.values()))} 张样板)")
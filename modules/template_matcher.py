@@ -1,7 +1,24 @@
 import cv2
+import collections
+import concurrent.futures
+import functools
+import hashlib
+import json
 import os
+import threading
 import numpy as np
-import pyautogui
+
+from . import template_bundle
+from .capture_backends import create_capture_backend
+from .tracer import Tracer
+
+def _synchronized(method):
+    """匹配过程共享结果缓冲区和各类缓存，多线程调用时需串行执行"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
 
 class TemplateMatcher:
     """
@@ -9,7 +26,22 @@ class TemplateMatcher:
     支持每个逻辑目标对应多个样板图片（不同分辨率、状态等）
     """
     
-    def __init__(self, assets_dir="assets", confidence=0.8, log=None):
+    # 缩小后样板的最小边长（像素），更小的样板特征不足，匹配不可靠
+    MIN_SCALED_SIZE = 8
+    # 灰度标准差低于该值的样板视为纯色：TM_CCOEFF_NORMED 对纯色样板没有定义，会在任意位置误报
+    MIN_TEMPLATE_STD = 1.0
+    # 金字塔粗匹配的最小缩放比例：缩到 0.25 时粗匹配分数和坐标误差都明显变大，
+    # 目标会漏检或精匹配到别的位置；0.5 的结果与全分辨率一致
+    MIN_PYRAMID_SCALE = 0.5
+    
+    def __init__(self, assets_dir="assets", confidence=0.8, log=None,
+                 prior_file=None, prior_padding=40,
+                 pyramid_scale=None, pyramid_margin=0.15, pyramid_candidates=3,
+                 template_scales=None, scale_cache_file=None, nms_radius=20,
+                 bundle_file=None, change_detection=False, change_cell=16, change_threshold=8,
+                 workers=None, capture_backend=None, capture_options=None, tracer=None,
+                 match_cache_size=0, fingerprint_stride=4,
+                 stats_file=None, adaptive_order=False, demote_after=None):
         """
         初始化加载器
         
@@ -17,52 +49,327 @@ class TemplateMatcher:
             assets_dir: 资源根目录路径
             confidence: 匹配阈值 (0~1)
             log: 日志对象
+            prior_file: 位置先验文件路径，为None则只在内存中记录不持久化
+            prior_padding: 先验区域向四周扩展的像素数
+            pyramid_scale: 金字塔粗匹配的缩放比例（如 0.5），为None则全分辨率匹配；
+                           小于 MIN_PYRAMID_SCALE 时按 MIN_PYRAMID_SCALE 处理
+            pyramid_margin: 粗匹配阈值相对 confidence 的放宽量
+            pyramid_candidates: 每个样板在粗匹配中保留的候选峰值数
+            template_scales: 样板缩放比例列表（如 [0.75, 1.0, 1.25]），用于适配不同模拟器分辨率，
+                             为None则只使用原图
+            scale_cache_file: 缩放样板的磁盘缓存文件 (.npz)，按图片内容哈希索引，为None则不缓存
+            nms_radius: find_all_targets 中视为同一目标的距离（像素）
+            bundle_file: 编译后的样板包路径，源图片或参数变化时自动重建，为None则每次解码图片
+            change_detection: 是否启用画面变化检测，find_targets 在画面未变化的区域复用上次结果
+            change_cell: 变化检测的缩略图格子边长（像素）
+            change_threshold: 格子平均灰度差超过该值才视为变化
+            workers: 并行匹配的线程数，同一帧上的 (目标, 样板) 匹配分发到线程池，为None则串行匹配
+            capture_backend: 截屏后端对象或名称（pyautogui / mss / raw / replay / adb），为None则使用 pyautogui
+            capture_options: 按名称创建截屏后端时传入的参数（如 adb 的 serial、adb_path）
+            tracer: 耗时追踪器，记录截屏和每次样板匹配的耗时，为None则不记录
+            match_cache_size: 匹配结果 LRU 缓存的条目数，按 (帧指纹, 目标, 阈值, 区域) 索引，
+                              同一画面上的重复查询直接返回缓存结果；0 表示不缓存
+            fingerprint_stride: 计算帧指纹时的采样步长（像素），越大越快，但越可能忽略细小变化
+            stats_file: 样板命中统计文件路径，为None则只在内存中统计不持久化
+            adaptive_order: 是否按历史命中率调整同一目标下样板的尝试顺序，命中率高的先试
+            demote_after: 同一目标的其他样板命中时，某样板累计落空达到该次数且从未命中，
+                          则不再尝试该样板；为None则只调整顺序，不剔除
         """
         self.assets_dir = assets_dir
         self.confidence = confidence
+        self._lock = threading.RLock()
+        if capture_backend is None or isinstance(capture_backend, str):
+            capture_backend = create_capture_backend(capture_backend or "pyautogui", log=log,
+                                                     **(capture_options or {}))
+        self.capture_backend = capture_backend
         self.log = log
+        self.tracer = tracer or Tracer(enabled=False)
+        self.nms_radius = nms_radius
+        self.prior_file = prior_file
+        self.prior_padding = prior_padding
+        # 位置先验: {逻辑名: {"template": 样板序号, "x": 左上角x, "y": 左上角y}}
+        self.location_priors = {}
+        self._load_priors()
         # 核心数据结构: {逻辑名: [图片1, 图片2, ...]}
         self.templates = {}
         self.template_sizes = {}  # 存储每个模板的尺寸
+        # 缩放比例按与原图的接近程度排序，原图 (1.0) 优先
+        self.template_scales = sorted(set(template_scales or [1.0]), key=lambda x: abs(x - 1.0))
+        self.variant_scales = {}  # {逻辑名: [每张样板对应的缩放比例]}
+        self.matched_scale = None  # 首次命中后锁定的缩放比例
+        self.scale_cache_file = scale_cache_file
+        self._scale_cache = {}  # {"哈希_比例": 缩放后的样板}
+        self._scale_cache_used = set()  # 本次加载实际用到的缓存键
+        self._scale_cache_stored = set()  # 磁盘缓存文件中已有的键
+        self.bundle_file = bundle_file
+        self.template_moments = {}  # 样板灰度统计量: {逻辑名: [(均值, 标准差)]}，随样板包保存
+        self._buffers = threading.local()  # 每个线程复用自己的匹配结果矩阵
+        # cv2.matchTemplate 执行时释放 GIL，多个匹配可以在线程池中真正并行
+        self._executor = (concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="matcher")
+                          if workers and workers > 1 else None)
+        if pyramid_scale and pyramid_scale < self.MIN_PYRAMID_SCALE:
+            if log:
+                log.warning(f"pyramid_scale={pyramid_scale} 过小，粗匹配会漏检，已改为 {self.MIN_PYRAMID_SCALE}")
+            pyramid_scale = self.MIN_PYRAMID_SCALE
+        self.pyramid_scale = pyramid_scale if pyramid_scale and pyramid_scale < 1 else None
+        self.pyramid_margin = pyramid_margin
+        self.pyramid_candidates = pyramid_candidates
+        # 金字塔缩小后的样板: {逻辑名: [缩小图 或 None]}，None 表示样板太小不适合粗匹配
+        self.small_templates = {}
+        self._small_frame = (None, None)  # 最近一次缩小的帧: (原帧, 缩小帧)
+        self.change_detection = change_detection
+        self.change_cell = change_cell
+        self.change_threshold = change_threshold
+        # 变化检测缓存: {逻辑名: (匹配时的缩略图, 截图区域偏移, 匹配结果)}
+        self._change_cache = {}
+        self.match_cache_size = match_cache_size
+        self.fingerprint_stride = fingerprint_stride
+        # 匹配结果缓存: {(帧指纹, 类型, 逻辑名, 阈值, 区域): 结果}，按最近使用排序
+        self._match_cache = collections.OrderedDict()
+        self._fingerprinted = (None, None)  # 最近一次计算指纹的帧: (帧, 指纹)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.stats_file = stats_file
+        self.adaptive_order = adaptive_order
+        self.demote_after = demote_after
+        self.variant_names = {}  # {逻辑名: [每张样板的名称 "文件名@缩放比例"]}，统计按名称记录，与加载顺序无关
+        # 样板命中统计: {逻辑名: {样板名: [命中次数, 落空次数]}}
+        # 只在目标被某张样板命中时记录：命中的样板计一次命中，在它之前试过的样板各计一次落空；
+        # 目标不在画面上时所有样板都会落空，不反映样板的好坏，不计入
+        self.template_hits = {}
+        self._stats_dirty = False
+        self._orders = {}  # {逻辑名: 样板尝试顺序}，统计变化后重新计算
+        self._load_template_stats()
         self._load_all_assets()
+        self._flat_templates = self._find_flat_templates()
     
     def _load_all_assets(self):
-        """遍历目录，加载所有图片到内存"""
+        """遍历目录，加载所有图片到内存；样板包有效时直接内存映射加载"""
         if not os.path.exists(self.assets_dir):
             if self.log:
                 self.log.error(f"资源目录不存在: {self.assets_dir}")
             return
         
-        # 遍历 assets 下的每一个子文件夹
+        # 读取所有图片的原始字节，用于计算内容哈希（不解码）
+        sources = {}  # {逻辑名: [(文件名, 原始字节)]}
         for folder_name in sorted(os.listdir(self.assets_dir)):
             folder_path = os.path.join(self.assets_dir, folder_name)
             
             # 确保是文件夹
             if os.path.isdir(folder_path):
-                self.templates[folder_name] = []
-                self.template_sizes[folder_name] = []
-                
-                # 读取文件夹内的所有图片
+                sources[folder_name] = []
                 for filename in sorted(os.listdir(folder_path)):
                     if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp')):
                         img_path = os.path.join(folder_path, filename)
-                        # 读取为灰度图，提高匹配速度和鲁棒性
-                        img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
-                        
-                        if img is not None:
-                            self.templates[folder_name].append(img)
-                            self.template_sizes[folder_name].append(img.shape[:2])
-                            if self.log:
-                                self.log.debug(f"加载样板: {folder_name}/{filename}")
-                        else:
-                            if self.log:
-                                self.log.warning(f"无法读取图片: {img_path}")
+                        sources[folder_name].append((filename, np.fromfile(img_path, dtype=np.uint8)))
+        
+        digests = {
+            f"{folder_name}/{filename}": hashlib.sha1(data).hexdigest()
+            for folder_name, files in sources.items()
+            for filename, data in files
+        }
+        bundle_params = {
+            "template_scales": self.template_scales,
+            "pyramid_scale": self.pyramid_scale,
+            "min_scaled_size": self.MIN_SCALED_SIZE,
+        }
+        
+        if self.bundle_file:
+            try:
+                bundle = template_bundle.load_bundle(self.bundle_file, digests, bundle_params)
+            except (OSError, ValueError) as e:
+                bundle = None
+                if self.log:
+                    self.log.warning(f"样板包无法读取，将重新构建: {e}")
+            if bundle:
+                self.templates = bundle["templates"]
+                self.variant_scales = bundle["variant_scales"]
+                self.small_templates = bundle["small_templates"]
+                self.template_moments = bundle["template_moments"]
+                self.variant_names = bundle["variant_names"]
+                self.template_sizes = {name: [t.shape[:2] for t in templates]
+                                       for name, templates in self.templates.items()}
+                if self.log:
+                    self.log.info(f"从样板包加载 {len(digests)} 张样板: {self.bundle_file}")
+                return
+        
+        self._load_scale_cache()
+        for folder_name, files in sources.items():
+            self.templates[folder_name] = []
+            self.template_sizes[folder_name] = []
+            self.variant_scales[folder_name] = []
+            self.variant_names[folder_name] = []
+            originals = []  # [(图片, 内容哈希, 文件名)]
+            
+            for filename, data in files:
+                # 读取为灰度图，提高匹配速度和鲁棒性
+                img = cv2.imdecode(data, cv2.IMREAD_GRAYSCALE)
                 
+                if img is not None:
+                    originals.append((img, digests[f"{folder_name}/{filename}"], filename))
+                    if self.log:
+                        self.log.debug(f"加载样板: {folder_name}/{filename}")
+                else:
+                    if self.log:
+                        self.log.warning(f"无法读取图片: {os.path.join(self.assets_dir, folder_name, filename)}")
+            
+            # 按缩放比例展开样板，同一比例的样板排在一起
+            for scale in self.template_scales:
+                for img, digest, filename in originals:
+                    variant = img if scale == 1.0 else self._scaled_template(img, digest, scale)
+                    if variant is None:
+                        continue
+                    self.templates[folder_name].append(variant)
+                    self.template_sizes[folder_name].append(variant.shape[:2])
+                    self.variant_scales[folder_name].append(scale)
+                    self.variant_names[folder_name].append(f"{filename}@{scale:g}")
+            
+            if self.log:
+                count = len(originals)
+                if count > 0:
+                    self.log.info(f"[{folder_name}] 加载了 {count} 张样板")
+        
+        # 有新生成或已失效的条目时重写缓存文件
+        if self.scale_cache_file and self._scale_cache_stored != self._scale_cache_used:
+            self._save_scale_cache()
+        
+        if self.pyramid_scale:
+            self._build_small_templates()
+        
+        for name, templates in self.templates.items():
+            self.template_moments[name] = []
+            for template in templates:
+                mean, std = cv2.meanStdDev(template)
+                self.template_moments[name].append((float(mean[0][0]), float(std[0][0])))
+        
+        if self.bundle_file:
+            try:
+                template_bundle.write_bundle(self.bundle_file, digests, bundle_params,
+                                             self.templates, self.variant_scales, self.small_templates,
+                                             self.template_moments, self.variant_names)
                 if self.log:
-                    count = len(self.templates[folder_name])
-                    if count > 0:
-                        self.log.info(f"[{folder_name}] 加载了 {count} 张样板")
+                    self.log.info(f"样板包已重新构建: {self.bundle_file}")
+            except OSError as e:
+                if self.log:
+                    self.log.warning(f"样板包保存失败: {e}")
+    
+    def _find_flat_templates(self):
+        """
+        按灰度标准差找出纯色样板，匹配时跳过
+        
+        返回:
+            {(逻辑名, 样板序号)}
+        """
+        flat = set()
+        for name, moments in self.template_moments.items():
+            for i, (mean, std) in enumerate(moments):
+                if std < self.MIN_TEMPLATE_STD:
+                    flat.add((name, i))
+                    if self.log:
+                        self.log.warning(f"[{name}] 样板{i+1} 是纯色图片（标准差 {std:.2f}），已跳过")
+        return flat
+    
+    def _scaled_template(self, img, digest, scale):
+        """
+        获取缩放后的样板，优先从磁盘缓存读取
+        
+        返回:
+            缩放后的灰度图，缩放后过小时返回 None
+        """
+        key = f"{digest}_{scale:g}"
+        if key in self._scale_cache:
+            self._scale_cache_used.add(key)
+            return self._scale_cache[key]
+        
+        h, w = img.shape[:2]
+        sw, sh = int(round(w * scale)), int(round(h * scale))
+        if sw < self.MIN_SCALED_SIZE or sh < self.MIN_SCALED_SIZE:
+            return None
+        interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+        scaled = cv2.resize(img, (sw, sh), interpolation=interpolation)
+        self._scale_cache[key] = scaled
+        self._scale_cache_used.add(key)
+        return scaled
+    
+    def _load_scale_cache(self):
+        """从磁盘加载缩放样板缓存"""
+        if not self.scale_cache_file or not os.path.exists(self.scale_cache_file):
+            return
+        try:
+            with np.load(self.scale_cache_file) as cache:
+                self._scale_cache = {key: cache[key] for key in cache.files}
+            self._scale_cache_stored = set(self._scale_cache)
+        except (OSError, ValueError) as e:
+            self._scale_cache = {}
+            if self.log:
+                self.log.warning(f"缩放样板缓存无法读取，将重新生成: {e}")
     
+    def _save_scale_cache(self):
+        """将缩放样板缓存写入磁盘（只保留当前资源仍在使用的条目）"""
+        self._scale_cache = {key: self._scale_cache[key] for key in self._scale_cache_used}
+        try:
+            with open(self.scale_cache_file, 'wb') as f:
+                np.savez(f, **self._scale_cache)
+            self._scale_cache_stored = set(self._scale_cache)
+        except OSError as e:
+            if self.log:
+                self.log.warning(f"缩放样板缓存保存失败: {e}")
+    
+    def _scale_allowed(self, target_name, index):
+        """已锁定缩放比例时，只匹配该比例的样板"""
+        return self.matched_scale is None or self.variant_scales[target_name][index] == self.matched_scale
+    
+    def _lock_scale(self, target_name, index):
+        """记录首次命中的缩放比例，之后只搜索该比例"""
+        if self.matched_scale is None and len(self.template_scales) > 1:
+            self.matched_scale = self.variant_scales[target_name][index]
+            if self.log:
+                self.log.info(f"锁定样板缩放比例: {self.matched_scale:g}")
+    
+    def reset_scale(self):
+        """解除缩放比例锁定（模拟器分辨率变化后调用）"""
+        self.matched_scale = None
+    
+    def _build_small_templates(self):
+        """为金字塔模式预先缩小所有样板"""
+        for name, templates in self.templates.items():
+            self.small_templates[name] = []
+            for template in templates:
+                h, w = template.shape[:2]
+                sw, sh = int(w * self.pyramid_scale), int(h * self.pyramid_scale)
+                # 缩小后过小的样板特征不足，粗匹配不可靠，改为全分辨率匹配
+                if sw < self.MIN_SCALED_SIZE or sh < self.MIN_SCALED_SIZE:
+                    self.small_templates[name].append(None)
+                else:
+                    self.small_templates[name].append(
+                        cv2.resize(template, (sw, sh), interpolation=cv2.INTER_AREA))
+    
+    def capture_frame(self, region=None, dst=None):
+        """
+        截取一帧屏幕并转换为灰度图
+        
+        同一轮轮询中的所有检测应共用这一帧，避免重复截屏，
+        也保证各项判断基于同一时刻的画面
+        
+        参数:
+            region: 截屏区域 (left, top, width, height)，为None则全屏
+            dst: 预先分配的灰度缓冲区，结果直接写入其中（如截屏线程的环形缓冲区）
+        
+        返回:
+            灰度图 (numpy.ndarray)
+        """
+        with self.tracer.span("capture"):
+            return self.capture_backend.grab(region, dst)
+    
+    def _to_gray(self, screen_image=None, region=None):
+        """将传入的截图统一为灰度图，为None则自动截屏"""
+        if screen_image is None:
+            return self.capture_frame(region)
+        if len(screen_image.shape) == 3:
+            return cv2.cvtColor(screen_image, cv2.COLOR_BGR2GRAY)
+        return screen_image
+    
+    @_synchronized
     def find_target(self, target_name, screen_image=None, region=None):
         """
         在屏幕截图中寻找目标
@@ -85,46 +392,312 @@ class TemplateMatcher:
                 self.log.error(f"{target_name} 文件夹中没有图片")
             return None
         
-        # 自动截屏
-        if screen_image is None:
-            if region:
-                screen_image = pyautogui.screenshot(region=region)
+        # 未传入帧时自动截屏，并确保是灰度图
+        screen_gray = self._to_gray(screen_image, region)
+        
+        key = self._cache_key(screen_gray, "one", target_name, region)
+        if key in self._match_cache:
+            return self._cache_get(key)
+        pos = self._match_many({target_name: (screen_gray, region)})[target_name]
+        self._cache_put(key, pos)
+        return pos
+    
+    @_synchronized
+    def find_targets(self, target_names, screen_image=None, region=None):
+        """
+        在同一帧上批量查找多个目标
+        
+        灰度转换、尺寸检查和结果矩阵分配在所有样板间共享；
+        每个目标命中任一样板后即停止，不再尝试其余样板
+        
+        参数:
+            target_names: 逻辑目标名称列表（重复名称只匹配一次）
+            screen_image: 屏幕截图（OpenCV格式），为None则自动截屏
+            region: 截屏区域 (left, top, width, height)，为None则全屏
+        
+        返回:
+            {目标名: (x, y) 或 None}
+        """
+        screen_gray = self._to_gray(screen_image, region)
+        off = (region[0], region[1]) if region else (0, 0)
+        thumb = self._thumbnail(screen_gray) if self.change_detection else None
+        changed_boxes = {}  # {id(旧缩略图): 变化区域}，同一旧帧只比较一次
+        
+        hits = {}
+        jobs = {}  # 需要实际匹配的目标: {目标名: (灰度图, 偏移区域)}
+        keys = {}  # {目标名: 缓存键}
+        reused = set()  # 沿用变化检测缓存结果的目标，其参考缩略图保持不变
+        for target_name in target_names:
+            if target_name in hits or target_name in jobs:
+                continue
+            if not self.templates.get(target_name):
+                if self.log:
+                    self.log.error(f"未找到名为 {target_name} 的样板定义或文件夹中没有图片")
+                hits[target_name] = None
+                continue
+            
+            key = keys[target_name] = self._cache_key(screen_gray, "one", target_name, region)
+            if key in self._match_cache:
+                hits[target_name] = self._cache_get(key)
+                continue
+            
+            cached = self._change_cache.get(target_name) if self.change_detection else None
+            if cached and cached[0].shape == thumb.shape and cached[1] == off:
+                old_thumb, _, old_pos = cached
+                if id(old_thumb) not in changed_boxes:
+                    changed_boxes[id(old_thumb)] = self._changed_box(old_thumb, thumb, screen_gray.shape)
+                job = self._plan_rematch(target_name, screen_gray, region, off, old_pos,
+                                         changed_boxes[id(old_thumb)])
+                if job is None:
+                    hits[target_name] = old_pos
+                    reused.add(target_name)
+                else:
+                    jobs[target_name] = job
             else:
-                screen_image = pyautogui.screenshot()
-            screen_image = cv2.cvtColor(np.array(screen_image), cv2.COLOR_RGB2BGR)
+                jobs[target_name] = (screen_gray, region)
         
-        # 确保屏幕截图是灰度图
-        if len(screen_image.shape) == 3:
-            screen_gray = cv2.cvtColor(screen_image, cv2.COLOR_BGR2GRAY)
-        else:
-            screen_gray = screen_image
+        hits.update(self._match_many(jobs))
+        for target_name, key in keys.items():
+            self._cache_put(key, hits[target_name])
         
-        # 遍历该目标下的所有样板图片
-        for i, template in enumerate(self.templates[target_name]):
-            try:
-                # 模板必须小于屏幕
-                if template.shape[0] > screen_gray.shape[0] or template.shape[1] > screen_gray.shape[1]:
+        if self.change_detection:
+            # 只在结果确实基于当前帧时更新参考缩略图；沿用旧结果时仍与算出该结果的帧比较，
+            # 否则渐变、进度条等缓慢变化每帧都低于阈值，永远不会触发重新匹配
+            for target_name, pos in hits.items():
+                if self.templates.get(target_name) and target_name not in reused:
+                    self._change_cache[target_name] = (thumb, off, pos)
+        
+        return hits
+    
+    def _thumbnail(self, screen_gray):
+        """生成变化检测用的缩略图，每个像素是一个格子的平均灰度"""
+        h, w = screen_gray.shape[:2]
+        size = (max(w // self.change_cell, 1), max(h // self.change_cell, 1))
+        return cv2.resize(screen_gray, size, interpolation=cv2.INTER_AREA)
+    
+    def _changed_box(self, old_thumb, thumb, frame_shape):
+        """
+        比较前后两帧缩略图
+        
+        返回:
+            变化区域 (x0, y0, x1, y1)（帧坐标，已向外扩展一个格子），未变化返回 None
+        """
+        mask = cv2.absdiff(old_thumb, thumb) > self.change_threshold
+        ys, xs = np.nonzero(mask)
+        if len(xs) == 0:
+            return None
+        cell = self.change_cell
+        h, w = frame_shape[:2]
+        return (max((int(xs.min()) - 1) * cell, 0), max((int(ys.min()) - 1) * cell, 0),
+                min((int(xs.max()) + 2) * cell, w), min((int(ys.max()) + 2) * cell, h))
+    
+    def _plan_rematch(self, target_name, screen_gray, region, off, old_pos, box):
+        """
+        根据变化区域决定复用上次结果、只在变化区域内匹配，还是整帧重新匹配
+        
+        返回:
+            None 表示直接复用上次结果；否则为需要匹配的 (灰度图, 偏移区域)
+        """
+        if box is None:
+            return None
+        
+        x0, y0, x1, y1 = box
+        max_h = max(h for h, w in self.template_sizes[target_name])
+        max_w = max(w for h, w in self.template_sizes[target_name])
+        
+        if old_pos is not None:
+            # 上次命中的位置不在变化区域内，结果仍然有效
+            cx, cy = old_pos[0] - off[0], old_pos[1] - off[1]
+            if (cx + max_w // 2 < x0 or cx - max_w // 2 > x1 or
+                    cy + max_h // 2 < y0 or cy - max_h // 2 > y1):
+                return None
+            return (screen_gray, region)
+        
+        # 上次未命中：目标只可能出现在变化区域，扩展一个样板尺寸后只搜索这一块
+        h, w = screen_gray.shape[:2]
+        rx0, ry0 = max(x0 - max_w, 0), max(y0 - max_h, 0)
+        rx1, ry1 = min(x1 + max_w, w), min(y1 + max_h, h)
+        return (screen_gray[ry0:ry1, rx0:rx1], (rx0 + off[0], ry0 + off[1]))
+    
+    @_synchronized
+    def reset_change_cache(self):
+        """清空变化检测缓存，下一次 find_targets 整帧重新匹配"""
+        self._change_cache = {}
+    
+    @_synchronized
+    def invalidate_cache(self):
+        """
+        清空匹配结果缓存（点击之后调用）
+        点击后画面即将变化，但变化可能还没反映到下一帧上，不能凭指纹相同就沿用点击前的结果
+        """
+        self._match_cache.clear()
+        self._fingerprinted = (None, None)
+    
+    def _fingerprint(self, screen_gray):
+        """按步长采样整帧像素计算哈希，作为帧指纹；同一帧对象只计算一次"""
+        frame, fingerprint = self._fingerprinted
+        if frame is not screen_gray:
+            step = self.fingerprint_stride
+            sample = np.ascontiguousarray(screen_gray[::step, ::step])
+            fingerprint = (screen_gray.shape, hashlib.blake2b(sample, digest_size=16).digest())
+            self._fingerprinted = (screen_gray, fingerprint)
+        return fingerprint
+    
+    def _cache_key(self, screen_gray, kind, target_name, region):
+        """
+        返回:
+            匹配缓存的键，未启用缓存时返回 None
+        """
+        if not self.match_cache_size:
+            return None
+        return (self._fingerprint(screen_gray), kind, target_name, self.confidence,
+                tuple(region) if region else None)
+    
+    def _cache_get(self, key):
+        self._match_cache.move_to_end(key)
+        self.cache_hits += 1
+        return self._match_cache[key]
+    
+    def _cache_put(self, key, value):
+        if key is None:
+            return
+        if key not in self._match_cache:
+            self.cache_misses += 1
+        self._match_cache[key] = value
+        self._match_cache.move_to_end(key)
+        while len(self._match_cache) > self.match_cache_size:
+            self._match_cache.popitem(last=False)
+    
+    def _match_template(self, screen_gray, template):
+        """
+        执行一次模板匹配，复用结果矩阵的内存
+        
+        返回:
+            匹配结果矩阵，模板大于屏幕时返回 None
+        """
+        sh, sw = screen_gray.shape[:2]
+        th, tw = template.shape[:2]
+        # 模板必须小于屏幕
+        if th > sh or tw > sw:
+            return None
+        
+        # 同一线程的所有样板共用一块扁平缓冲区，按需扩容后切出所需尺寸的连续视图
+        rh, rw = sh - th + 1, sw - tw + 1
+        flat = getattr(self._buffers, "result", None)
+        if flat is None or flat.size < rh * rw:
+            flat = self._buffers.result = np.empty(rh * rw, dtype=np.float32)
+        buf = flat[:rh * rw].reshape(rh, rw)
+        return cv2.matchTemplate(screen_gray, template, cv2.TM_CCOEFF_NORMED, result=buf)
+    
+    def _match_many(self, jobs):
+        """
+        执行一组目标的匹配，启用线程池时并行执行
+        
+        参数:
+            jobs: {目标名: (灰度图, 偏移区域)}
+        
+        返回:
+            {目标名: (x, y) 或 None}
+        """
+        if self._executor is None:
+            return {name: self._match_target(name, gray, region) for name, (gray, region) in jobs.items()}
+        return self._match_parallel(jobs)
+    
+    def _match_parallel(self, jobs):
+        """
+        把所有 (目标, 样板) 匹配分发到线程池
+        某个目标一旦有样板命中，就取消该目标尚未开始的其余匹配；
+        多个样板都命中时取尝试顺序最靠前的，与串行匹配的结果一致
+        """
+        hits = {}
+        futures = {}  # {future: (目标名, 样板序号)}
+        by_target = {}  # {目标名: [future, ...]}
+        ranks = {}  # {目标名: {样板序号: 在尝试顺序中的位置}}
+        for name, (gray, region) in jobs.items():
+            off_x, off_y = (region[0], region[1]) if region else (0, 0)
+            # 先验区域很小，直接在当前线程匹配
+            prior = self.location_priors.get(name)
+            if prior:
+                pos = self._match_in_prior(name, gray, prior, off_x, off_y)
+                if pos:
+                    hits[name] = pos
                     continue
-                
+            
+            hits[name] = None
+            by_target[name] = []
+            if self.pyramid_scale:
+                # 在分发之前缩小好整帧，避免多个线程重复缩小
+                self._downscale_frame(gray)
+            order = self._template_order(name)
+            ranks[name] = {i: rank for rank, i in enumerate(order)}
+            for i in order:
+                if self._scale_allowed(name, i):
+                    future = self._executor.submit(self._locate, name, i, gray)
+                    futures[future] = (name, i)
+                    by_target[name].append(future)
+        
+        found = {}  # {目标名: [(样板序号, 置信度, 左上角x, 左上角y), ...]}
+        below = {}  # {目标名: [低于阈值的样板序号, ...]}
+        for future in concurrent.futures.as_completed(futures):
+            if future.cancelled():
+                continue
+            name, i = futures[future]
+            try:
+                located = future.result()
+            except Exception as e:
+                if self.log:
+                    self.log.debug(f"匹配 {name} 样板{i+1} 时出错: {e}")
+                continue
+            if located is None:
+                continue
+            if located[0] < self.confidence:
+                below.setdefault(name, []).append(i)
+                continue
+            region = jobs[name][1]
+            off_x, off_y = (region[0], region[1]) if region else (0, 0)
+            max_val, max_loc = located
+            found.setdefault(name, []).append((i, max_val, max_loc[0] + off_x, max_loc[1] + off_y))
+            for other in by_target[name]:
+                other.cancel()
+        
+        for name, candidates in found.items():
+            rank = ranks[name]
+            i, max_val, left, top = min(candidates, key=lambda candidate: rank[candidate[0]])
+            self._record_outcome(name, i, [j for j in below.get(name, []) if rank[j] < rank[i]])
+            hits[name] = self._accept_hit(name, i, max_val, left, top)
+        return hits
+    
+    def _match_target(self, target_name, screen_gray, region=None):
+        """
+        在灰度帧上依次尝试目标的所有样板，返回首个命中的中心坐标或 None
+        
+        若该目标有位置先验，先在先验附近的小区域内搜索，未命中再全屏搜索
+        """
+        # 截图区域左上角在屏幕上的偏移
+        off_x, off_y = (region[0], region[1]) if region else (0, 0)
+        
+        prior = self.location_priors.get(target_name)
+        if prior:
+            pos = self._match_in_prior(target_name, screen_gray, prior, off_x, off_y)
+            if pos:
+                return pos
+        
+        # 遍历该目标下的所有样板图片（启用 adaptive_order 时按历史命中率排序）
+        missed = []
+        for i in self._template_order(target_name):
+            if not self._scale_allowed(target_name, i):
+                continue
+            try:
                 # 执行模板匹配
-                res = cv2.matchTemplate(screen_gray, template, cv2.TM_CCOEFF_NORMED)
-                min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
+                located = self._locate(target_name, i, screen_gray)
+                if located is None:
+                    continue
+                max_val, max_loc = located
                 
                 if max_val >= self.confidence:
-                    # 找到匹配，计算中心点
-                    h, w = template.shape[:2]
-                    center_x = max_loc[0] + w // 2
-                    center_y = max_loc[1] + h // 2
-                    
-                    if self.log:
-                        self.log.info(f"匹配 [{target_name}] 样板{i+1} 成功 (置信度: {max_val:.2f})")
-                    
-                    # 如果指定了region，需要加上偏移量
-                    if region:
-                        center_x += region[0]
-                        center_y += region[1]
-                    
-                    return (center_x, center_y)
+                    self._record_outcome(target_name, i, missed)
+                    return self._accept_hit(target_name, i, max_val, max_loc[0] + off_x, max_loc[1] + off_y)
+                missed.append(i)
                     
             except Exception as e:
                 if self.log:
@@ -134,6 +707,243 @@ class TemplateMatcher:
         # 所有样板都试过了，都没匹配上
         return None
     
+    def _locate(self, target_name, index, screen_gray):
+        """
+        在整帧中定位单个样板的最佳匹配
+        
+        返回:
+            (最高置信度, 左上角坐标) 或 None（样板大于屏幕）
+        """
+        template = self.templates[target_name][index]
+        smalls = self.small_templates.get(target_name)
+        with self.tracer.span("match", target=target_name, template=index + 1):
+            if smalls and smalls[index] is not None:
+                return self._locate_pyramid(screen_gray, template, smalls[index])
+            
+            res = self._match_template(screen_gray, template)
+            if res is None:
+                return None
+            min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
+            return max_val, max_loc
+    
+    def _downscale_frame(self, screen_gray):
+        """缩小帧用于粗匹配，同一帧只缩小一次"""
+        frame, small = self._small_frame
+        if frame is not screen_gray:
+            h, w = screen_gray.shape[:2]
+            small = cv2.resize(screen_gray, (int(w * self.pyramid_scale), int(h * self.pyramid_scale)),
+                               interpolation=cv2.INTER_AREA)
+            self._small_frame = (screen_gray, small)
+        return small
+    
+    def _locate_pyramid(self, screen_gray, template, small_template):
+        """
+        金字塔由粗到精匹配：
+        先在缩小帧上找出若干候选峰值，再只在候选点附近的全分辨率窗口内
+        用 TM_CCOEFF_NORMED 精确匹配，因此返回的坐标和置信度与全分辨率匹配一致
+        
+        返回:
+            (最高置信度, 左上角坐标) 或 None（样板大于屏幕）
+        """
+        res = self._match_template(self._downscale_frame(screen_gray), small_template)
+        if res is None:
+            return None
+        
+        sh, sw = screen_gray.shape[:2]
+        h, w = template.shape[:2]
+        scale = self.pyramid_scale
+        # 粗匹配坐标换算回全分辨率后的误差范围
+        pad = int(np.ceil(2 / scale))
+        coarse_threshold = self.confidence - self.pyramid_margin
+        # 抑制已选候选点周围的区域，避免同一峰值被重复选中
+        sup_w, sup_h = max(small_template.shape[1] // 2, 1), max(small_template.shape[0] // 2, 1)
+        
+        best = (-1.0, (0, 0))
+        for _ in range(self.pyramid_candidates):
+            min_val, coarse_val, min_loc, (cx, cy) = cv2.minMaxLoc(res)
+            if coarse_val < coarse_threshold:
+                break
+            res[max(cy - sup_h, 0):cy + sup_h + 1, max(cx - sup_w, 0):cx + sup_w + 1] = -1.0
+            
+            # 在全分辨率窗口内精匹配
+            x0 = max(int(cx / scale) - pad, 0)
+            y0 = max(int(cy / scale) - pad, 0)
+            x1 = min(int(cx / scale) + w + pad, sw)
+            y1 = min(int(cy / scale) + h + pad, sh)
+            if x1 - x0 < w or y1 - y0 < h:
+                continue
+            fine = cv2.matchTemplate(screen_gray[y0:y1, x0:x1], template, cv2.TM_CCOEFF_NORMED)
+            min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(fine)
+            if max_val > best[0]:
+                best = (max_val, (x0 + max_loc[0], y0 + max_loc[1]))
+            if max_val >= self.confidence:
+                break
+        
+        return best
+    
+    def _match_in_prior(self, target_name, screen_gray, prior, off_x, off_y):
+        """
+        在位置先验附近的扩展区域内匹配先验记录的样板
+        
+        返回:
+            (x, y) 中心坐标 或 None
+        """
+        i = prior["template"]
+        templates = self.templates[target_name]
+        if (i >= len(templates) or not self._scale_allowed(target_name, i) or
+                (target_name, i) in self._flat_templates):
+            return None
+        template = templates[i]
+        h, w = template.shape[:2]
+        pad = self.prior_padding
+        
+        # 先验区域换算到当前帧坐标，并裁剪到帧内
+        sh, sw = screen_gray.shape[:2]
+        x0 = max(prior["x"] - off_x - pad, 0)
+        y0 = max(prior["y"] - off_y - pad, 0)
+        x1 = min(prior["x"] - off_x + w + pad, sw)
+        y1 = min(prior["y"] - off_y + h + pad, sh)
+        if x1 - x0 < w or y1 - y0 < h:
+            return None
+        
+        with self.tracer.span("match_prior", target=target_name, template=i + 1):
+            res = self._match_template(screen_gray[y0:y1, x0:x1], template)
+            if res is None:
+                return None
+            min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
+        if max_val < self.confidence:
+            return None
+        
+        self._record_outcome(target_name, i, ())
+        return self._accept_hit(target_name, i, max_val, x0 + max_loc[0] + off_x, y0 + max_loc[1] + off_y,
+                                "先验区域, ")
+    
+    def _accept_hit(self, target_name, index, max_val, left, top, note=""):
+        """
+        记录一次命中：写日志、更新位置先验、锁定缩放比例
+        
+        参数:
+            left, top: 命中位置左上角（屏幕坐标）
+        
+        返回:
+            (x, y) 中心坐标
+        """
+        if self.log:
+            self.log.info(f"匹配 [{target_name}] 样板{index+1} 成功 ({note}置信度: {max_val:.2f})")
+        self._update_prior(target_name, index, left, top)
+        self._lock_scale(target_name, index)
+        h, w = self.templates[target_name][index].shape[:2]
+        return (left + w // 2, top + h // 2)
+    
+    def _load_priors(self):
+        """从文件加载各目标的位置先验"""
+        if not self.prior_file or not os.path.exists(self.prior_file):
+            return
+        try:
+            with open(self.prior_file, 'r', encoding='utf-8') as f:
+                self.location_priors = json.load(f)
+            if self.log:
+                self.log.info(f"加载位置先验: {len(self.location_priors)} 个目标")
+        except (OSError, ValueError) as e:
+            self.location_priors = {}
+            if self.log:
+                self.log.warning(f"位置先验文件无法读取，已忽略: {e}")
+    
+    def _update_prior(self, target_name, template_index, left, top):
+        """
+        记录目标最近一次命中的位置（屏幕坐标下的左上角）
+        位置发生变化时才写回文件，稳定命中时不产生磁盘写入
+        """
+        prior = {"template": template_index, "x": int(left), "y": int(top)}
+        if self.location_priors.get(target_name) == prior:
+            return
+        self.location_priors[target_name] = prior
+        self.save_priors()
+    
+    def save_priors(self):
+        """将位置先验写入文件"""
+        if not self.prior_file:
+            return
+        try:
+            with open(self.prior_file, 'w', encoding='utf-8') as f:
+                json.dump(self.location_priors, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            if self.log:
+                self.log.warning(f"位置先验保存失败: {e}")
+    
+    def _template_order(self, target_name):
+        """
+        样板的尝试顺序（样板序号列表）
+        启用 adaptive_order 时按命中率从高到低排列，命中率相同（如都没有统计）时保持文件名顺序
+        """
+        order = self._orders.get(target_name)
+        if order is not None:
+            return order
+        
+        order = [i for i in range(len(self.templates[target_name]))
+                 if (target_name, i) not in self._flat_templates]
+        names = self.variant_names.get(target_name)
+        if self.adaptive_order and names:
+            stats = self.template_hits.get(target_name, {})
+            
+            def hit_rate(i):
+                hits, misses = stats.get(names[i], (0, 0))
+                # 拉普拉斯平滑：没有统计的样板按 0.5 计，排在经常落空的样板之前
+                return (hits + 1) / (hits + misses + 2)
+            
+            order.sort(key=hit_rate, reverse=True)
+            if self.demote_after:
+                kept = [i for i in order if not self._demoted(stats.get(names[i]))]
+                order = kept or order
+        self._orders[target_name] = order
+        return order
+    
+    def _demoted(self, entry):
+        """统计条目 [命中, 落空] 是否达到剔除条件：从未命中且落空次数达到 demote_after"""
+        return entry is not None and entry[0] == 0 and entry[1] >= self.demote_after
+    
+    def _record_outcome(self, target_name, hit_index, missed):
+        """
+        记录一次目标命中：命中的样板计一次命中，missed 中的样板（在它之前试过）各计一次落空
+        """
+        names = self.variant_names.get(target_name)
+        if not names:
+            return
+        stats = self.template_hits.setdefault(target_name, {})
+        stats.setdefault(names[hit_index], [0, 0])[0] += 1
+        for i in missed:
+            stats.setdefault(names[i], [0, 0])[1] += 1
+        self._stats_dirty = True
+        self._orders.pop(target_name, None)
+    
+    def _load_template_stats(self):
+        """从文件加载样板命中统计"""
+        if not self.stats_file or not os.path.exists(self.stats_file):
+            return
+        try:
+            with open(self.stats_file, 'r', encoding='utf-8') as f:
+                self.template_hits = json.load(f)
+            if self.log:
+                self.log.info(f"加载样板命中统计: {len(self.template_hits)} 个目标")
+        except (OSError, ValueError) as e:
+            self.template_hits = {}
+            if self.log:
+                self.log.warning(f"样板命中统计文件无法读取，已忽略: {e}")
+    
+    @_synchronized
+    def save_template_stats(self):
+        """将样板命中统计写入文件（自上次保存以来没有新的统计时不写入）"""
+        if not self.stats_file or not self._stats_dirty:
+            return
+        try:
+            with open(self.stats_file, 'w', encoding='utf-8') as f:
+                json.dump(self.template_hits, f, ensure_ascii=False, indent=2)
+            self._stats_dirty = False
+        except OSError as e:
+            if self.log:
+                self.log.warning(f"样板命中统计保存失败: {e}")
+    
+    @_synchronized
     def find_all_targets(self, target_name, screen_image=None, region=None):
         """
         查找所有匹配的目标（用于点击第N个场景）
@@ -144,61 +954,96 @@ class TemplateMatcher:
         if target_name not in self.templates:
             return []
         
-        # 自动截屏
-        if screen_image is None:
-            if region:
-                screen_image = pyautogui.screenshot(region=region)
-            else:
-                screen_image = pyautogui.screenshot()
-            screen_image = cv2.cvtColor(np.array(screen_image), cv2.COLOR_RGB2BGR)
+        # 未传入帧时自动截屏，并确保是灰度图
+        screen_gray = self._to_gray(screen_image, region)
         
-        # 确保是灰度图
-        if len(screen_image.shape) == 3:
-            screen_gray = cv2.cvtColor(screen_image, cv2.COLOR_BGR2GRAY)
-        else:
-            screen_gray = screen_image
+        key = self._cache_key(screen_gray, "all", target_name, region)
+        if key in self._match_cache:
+            return list(self._cache_get(key))
         
-        all_matches = []
+        # 各样板的峰值中心点及置信度
+        centers, scores = [], []
         
         # 遍历所有样板
-        for template in self.templates[target_name]:
+        for i, template in enumerate(self.templates[target_name]):
+            if not self._scale_allowed(target_name, i) or (target_name, i) in self._flat_templates:
+                continue
             try:
-                if template.shape[0] > screen_gray.shape[0] or template.shape[1] > screen_gray.shape[1]:
+                with self.tracer.span("match_all", target=target_name, template=i + 1):
+                    res = self._match_template(screen_gray, template)
+                    if res is None:
+                        continue
+                    
+                    # 找到所有大于阈值的局部峰值
+                    xs, ys, vals = self._extract_peaks(res)
+                if len(vals) == 0:
                     continue
                 
-                res = cv2.matchTemplate(screen_gray, template, cv2.TM_CCOEFF_NORMED)
-                
-                # 找到所有大于阈值的位置
-                loc = np.where(res >= self.confidence)
-                
-                for pt in zip(*loc[::-1]):
-                    h, w = template.shape[:2]
-                    center_x = pt[0] + w // 2
-                    center_y = pt[1] + h // 2
-                    
-                    if region:
-                        center_x += region[0]
-                        center_y += region[1]
-                    
-                    # 去重：如果距离已有匹配点太近，则跳过
-                    is_duplicate = False
-                    for existing in all_matches:
-                        dist = ((center_x - existing[0])**2 + (center_y - existing[1])**2)**0.5
-                        if dist < 20:  # 20像素内视为同一点
-                            is_duplicate = True
-                            break
-                    
-                    if not is_duplicate:
-                        all_matches.append((center_x, center_y))
+                h, w = template.shape[:2]
+                centers.append(np.stack([xs + w // 2, ys + h // 2], axis=1))
+                scores.append(vals)
                         
             except Exception as e:
                 continue
         
+        if not centers:
+            self._cache_put(key, ())
+            return []
+        
+        # 跨样板合并：按置信度从高到低保留，距离已保留点过近的视为同一点
+        centers = np.concatenate(centers)
+        keep = self._suppress(centers, np.concatenate(scores))
+        
+        off_x, off_y = (region[0], region[1]) if region else (0, 0)
+        all_matches = [(int(x) + off_x, int(y) + off_y) for x, y in centers[keep]]
+        
         # 按Y坐标排序（从上到下）
         all_matches.sort(key=lambda p: p[1])
         
+        self._cache_put(key, tuple(all_matches))
         return all_matches
     
+    def _extract_peaks(self, res):
+        """
+        向量化提取匹配结果中高于阈值的局部最大值
+        
+        用膨胀得到每个像素邻域内的最大值，只有等于邻域最大值的像素才是峰值，
+        耗时只与结果矩阵大小有关，与超过阈值的像素数量无关
+        
+        返回:
+            (xs, ys, scores) 三个等长数组
+        """
+        if cv2.minMaxLoc(res)[1] < self.confidence:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, np.empty(0, dtype=np.float32)
+        
+        size = 2 * self.nms_radius + 1
+        local_max = cv2.dilate(res, cv2.getStructuringElement(cv2.MORPH_RECT, (size, size)))
+        ys, xs = np.nonzero((res >= self.confidence) & (res >= local_max))
+        return xs, ys, res[ys, xs]
+    
+    def _suppress(self, centers, scores):
+        """
+        非极大值抑制：按置信度从高到低贪心保留，抑制半径内的其余点
+        
+        输入的已是局部峰值，数量很少，逐个保留时与全部点的距离计算是向量化的
+        
+        返回:
+            保留点的下标数组
+        """
+        order = np.argsort(-scores, kind="stable")
+        centers = centers[order]
+        suppressed = np.zeros(len(order), dtype=bool)
+        keep = []
+        radius_sq = self.nms_radius ** 2
+        for k in range(len(order)):
+            if suppressed[k]:
+                continue
+            keep.append(order[k])
+            d = centers[k + 1:] - centers[k]
+            suppressed[k + 1:] |= (d[:, 0] ** 2 + d[:, 1] ** 2) < radius_sq
+        return np.array(keep, dtype=np.int64)
+    
     def target_exists(self, target_name, screen_image=None):
         """
         检查目标是否存在（不返回坐标，仅检查）
@@ -0,0 +1,130 @@
+import json
+import threading
+import time
+
+# 轻量级耗时追踪：在截屏、匹配、点击、等待等阶段外包一层 span，
+# 记录开始时间和耗时，可导出为 Chrome trace（chrome://tracing 或 Perfetto 打开）
+# 未启用时 span() 返回共享的空对象，几乎没有额外开销
+
+
+class _NullSpan:
+    """未启用追踪时使用的空 span"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = self.tracer.clock()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = self.tracer.clock()
+        self.tracer._record(self.name, self.start, end - self.start, self.args)
+        return False
+
+
+class Tracer:
+    """
+    阶段耗时追踪器
+    每个 span 记录名称、开始时间、耗时、线程以及标签（步骤名、目标、样板序号等）
+    """
+
+    def __init__(self, enabled=True, clock=time.perf_counter, max_events=200000):
+        """
+        参数:
+            enabled: 是否记录，为 False 时所有 span 都是空操作
+            clock: 计时函数（秒）
+            max_events: 最多保留的事件数，超出后丢弃新事件，避免长时间运行占满内存
+        """
+        self.enabled = enabled
+        self.clock = clock
+        self.max_events = max_events
+        self.events = []  # [(名称, 开始, 耗时, 线程ID, 标签)]
+        self.dropped = 0
+        self.tags = {}  # 附加到之后所有 span 上的公共标签（如当前步骤名）
+        self._origin = clock()
+
+    def span(self, name, **args):
+        """
+        创建一个 span，用法: with tracer.span("match", target="login", template=1): ...
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        if self.tags:
+            args = {**self.tags, **args}
+        return _Span(self, name, args)
+
+    def set_tags(self, **tags):
+        """设置公共标签，值为None则移除该标签"""
+        merged = {**self.tags, **tags}
+        # 整体替换而不是原地修改，其他线程创建 span 时读到的始终是完整的字典
+        self.tags = {key: value for key, value in merged.items() if value is not None}
+
+    def _record(self, name, start, duration, args):
+        # list.append 在 GIL 下是原子的，多线程记录无需加锁
+        if len(self.events) >= self.max_events:
+            self.dropped += 1
+            return
+        self.events.append((name, start, duration, threading.get_ident(), args))
+
+    def summary(self):
+        """
+        按 span 名称汇总
+
+        返回:
+            {名称: {"count": 次数, "total_ms": 总耗时, "max_ms": 最长耗时}}，按总耗时降序
+        """
+        totals = {}
+        for name, start, duration, tid, args in list(self.events):
+            entry = totals.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] += duration * 1000
+            entry["max_ms"] = max(entry["max_ms"], duration * 1000)
+        return dict(sorted(totals.items(), key=lambda item: -item[1]["total_ms"]))
+
+    def log_summary(self, log):
+        """把汇总结果写入日志"""
+        if not log or not self.events:
+            return
+        log.info("阶段耗时统计:")
+        for name, entry in self.summary().items():
+            log.info(f"  {name:<16} {entry['count']:>6} 次  共 {entry['total_ms']:>10.1f} ms"
+                     f"  最长 {entry['max_ms']:>8.1f} ms")
+        if self.dropped:
+            log.info(f"  超出上限未记录的事件: {self.dropped}")
+
+    def to_chrome_trace(self):
+        """转换为 Chrome trace 事件格式（时间单位为微秒）"""
+        events = []
+        for name, start, duration, tid, args in list(self.events):
+            events.append({
+                "name": name,
+                "cat": args.get("step", "run") if args else "run",
+                "ph": "X",
+                "ts": (start - self._origin) * 1e6,
+                "dur": duration * 1e6,
+                "pid": 1,
+                "tid": tid,
+                "args": args,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path):
+        """导出为 Chrome trace JSON 文件"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_chrome_trace(), f, ensure_ascii=False, default=str)
@@ -1,9 +1,13 @@
-import pyautogui
 import time
 import os
 
-# 禁用pyautogui的安全功能(防止鼠标移动到屏幕边缘时抛出异常)
-pyautogui.FAILSAFE = True
+try:
+    import pyautogui
+    # 禁用pyautogui的安全功能(防止鼠标移动到屏幕边缘时抛出异常)
+    pyautogui.FAILSAFE = True
+except Exception:
+    # 无桌面环境（如 Linux 未设置 DISPLAY）下导入会失败，不影响其他模块的使用
+    pyautogui = None
 
 def find_and_click(image_path, log=None, confidence=0.8, max_attempts=3, retry_delay=2):
     """
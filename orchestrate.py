@@ -0,0 +1,152 @@
+"""
+多实例并行账号切换
+每个工作线程绑定一个雷电多开实例（配置文件 instances 段：实例序号和窗口区域），
+从任务队列中领取账号切换任务，结束后输出吞吐量。
+
+用法:
+    python orchestrate.py --jobs 6                  # 按 instances 段并行执行 6 个任务
+    python orchestrate.py --accounts a b c d        # 以账号名作为任务
+    python orchestrate.py --simulate 3 --jobs 9     # 用 3 个模拟界面代替模拟器，可在 Linux 上运行
+
+instances 中的实例可配置 region（窗口区域，pyautogui/mss 截屏）或 serial（adb 设备）。
+
+退出码: 0 全部成功，1 有任务失败
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from modules import logger
+from modules.capture_backends import create_capture_backend
+from modules.flow_simulator import SimulatedGame, VirtualClock
+from modules.game_bot import GameBot
+from modules.input_backends import create_input_backend
+from modules.orchestrator import (LDConsoleEmulator, OffsetInput, Orchestrator, RegionCapture,
+                                  prefixed_log)
+
+
+def build_simulated_workers(config, count, assets_dir, log):
+    """每个工作线程使用独立的模拟界面和虚拟时钟"""
+    workers = []
+    for index in range(count):
+        name = f"sim{index}"
+        worker_log = prefixed_log(log, name)
+        clock = VirtualClock()
+        game = SimulatedGame(clock, assets_dir=assets_dir, seed=index, log=worker_log)
+        matcher_options = dict(config.get("matcher", {}))
+        matcher_options.update({"capture_backend": game, "prior_file": None, "scale_cache_file": None,
+                                "stats_file": None})
+        bot = GameBot(
+            confidence=config.get("settings", {}).get("click_confidence", 0.8),
+            assets_dir=assets_dir,
+            log=worker_log,
+            matcher_options=matcher_options,
+            scheduler_options=config.get("scheduler"),
+            interrupt_options=dict(config.get("interrupts", {}), background=False),
+            capture_options=None,
+            input_backend=game,
+            clock=clock.monotonic,
+            sleep=clock.sleep
+        )
+        workers.append({"name": name, "bot": bot, "emulator": game})
+    return workers
+
+
+def build_instance_workers(config, assets_dir, log):
+    """
+    按 instances 段为每个雷电实例创建工作线程：
+    配置了 serial 的实例通过 adb 截屏和点击，互不干扰；
+    否则截屏限定在实例窗口区域内，点击坐标换算回屏幕坐标，所有实例共用一把点击锁
+    """
+    options = config.get("orchestrator", {})
+    matcher_config = config.get("matcher", {})
+    input_backend = create_input_backend(options.get("input_backend", "pyautogui"), log=log)
+    click_lock = threading.Lock()
+    workers = []
+    for instance in config.get("instances", []):
+        name = instance["name"]
+        worker_log = prefixed_log(log, name)
+        if instance.get("serial"):
+            adb_options = {"serial": instance["serial"], "adb_path": options.get("adb_path", "adb")}
+            capture = create_capture_backend("adb", log=log, **adb_options)
+            instance_input = create_input_backend("adb", log=log, **adb_options)
+        else:
+            region = instance["region"]
+            capture = RegionCapture(
+                create_capture_backend(matcher_config.get("capture_backend", "pyautogui"), log=log), region)
+            instance_input = OffsetInput(input_backend, (region[0], region[1]), click_lock)
+        matcher_options = dict(matcher_config)
+        matcher_options["capture_backend"] = capture
+        # 各实例的窗口位置不同，位置先验分开保存；样板命中统计同样分开，避免多个线程写同一个文件
+        for key in ("prior_file", "stats_file"):
+            if matcher_options.get(key):
+                base, ext = os.path.splitext(matcher_options[key])
+                matcher_options[key] = f"{base}_{name}{ext}"
+        bot = GameBot(
+            confidence=config["settings"]["click_confidence"],
+            assets_dir=assets_dir,
+            log=worker_log,
+            matcher_options=matcher_options,
+            scheduler_options=config.get("scheduler"),
+            interrupt_options=config.get("interrupts"),
+            capture_options=config.get("capture"),
+            input_backend=instance_input
+        )
+        emulator = None
+        if options.get("ldconsole") and "index" in instance:
+            emulator = LDConsoleEmulator(options["ldconsole"], instance["index"], log=worker_log)
+        workers.append({"name": name, "bot": bot, "emulator": emulator})
+    return workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多实例并行账号切换")
+    parser.add_argument("--jobs", type=int, default=None, help="任务数（默认每个实例一个）")
+    parser.add_argument("--accounts", nargs="+", help="账号列表，每个账号一个任务")
+    parser.add_argument("--simulate", type=int, default=0, metavar="N", help="使用 N 个模拟界面代替模拟器")
+    parser.add_argument("--assets", default="assets", help="样板目录")
+    parser.add_argument("--config", default="config.json", help="配置文件")
+    parser.add_argument("--log-file", default="orchestrate_run.log", help="日志文件")
+    args = parser.parse_args()
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    log = logger.setup_logger(args.log_file)
+
+    # 工作线程的 GameBot 依次在主线程中创建，避免并发生成样板包等磁盘缓存
+    if args.simulate:
+        workers = build_simulated_workers(config, args.simulate, args.assets, log)
+    else:
+        workers = build_instance_workers(config, args.assets, log)
+    if not workers:
+        print("没有可用的实例，请在 config.json 的 instances 段中配置")
+        sys.exit(1)
+
+    jobs = args.accounts or [f"job{i + 1}" for i in range(args.jobs or len(workers))]
+    log.info(f"并行执行 {len(jobs)} 个任务，工作实例 {len(workers)} 个")
+
+    orchestrator = Orchestrator(workers,
+                                restart_each_job=config.get("orchestrator", {}).get("restart_each_job", True),
+                                log=log)
+    summary = orchestrator.run(jobs)
+
+    print("")
+    print(f"{'实例':<10}{'任务':>6}{'成功':>6}{'忙碌(秒)':>10}")
+    for name, stats in summary["workers"].items():
+        print(f"{name:<10}{stats['jobs']:>6}{stats['succeeded']:>6}{stats['busy']:>10.1f}")
+    print(f"总计 {summary['jobs']} 个任务，成功 {summary['succeeded']}，失败 {summary['failed']}，"
+          f"用时 {summary['elapsed']:.1f} 秒，吞吐量 {summary['throughput']:.1f} 个/分钟")
+
+    if summary["failed"]:
+        print(f"RESULT: FAILED | 失败任务: {summary['failed']}/{summary['jobs']}")
+        sys.exit(1)
+    print(f"RESULT: SUCCESS | 任务: {summary['succeeded']}/{summary['jobs']}")
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
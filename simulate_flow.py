@@ -0,0 +1,135 @@
+"""
+GameBot 全流程模拟
+用样板拼出的模拟游戏界面代替 LDPlayer，配合虚拟时钟运行完整的八步流程和中断处理，
+所有 post_wait / 轮询等待只推进虚拟时间，几秒内即可跑完。可在 Linux 上无头运行。
+
+用法:
+    python simulate_flow.py
+    python simulate_flow.py --interrupt 5:offline_retry --interrupt 20:update_needed
+    python simulate_flow.py --initial accounts      # 从中途画面开始，验证步骤恢复
+    python simulate_flow.py --slow DL_entry:7       # 点击 DL_entry 后的切换延长到 7 秒
+
+退出码: 0 流程成功，1 流程失败
+"""
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from modules import logger
+from modules.flow_simulator import DEFAULT_SCREENS, SimulatedGame, VirtualClock
+from modules.game_bot import GameBot
+from modules.tracer import Tracer
+
+
+def parse_interrupt(text):
+    """解析 "时刻:目标" 形式的中断参数"""
+    at, target = text.split(":", 1)
+    return float(at), target
+
+
+def parse_slow(text):
+    """解析 "目标:秒" 形式的切换延时参数"""
+    target, delay = text.split(":", 1)
+    return target, float(delay)
+
+
+def build_screens(slow):
+    """
+    复制默认画面状态机，并把点击指定目标后的切换延时改为给定值
+
+    参数:
+        slow: [(目标, 秒), ...]
+
+    返回:
+        画面状态机
+    """
+    screens = copy.deepcopy(DEFAULT_SCREENS)
+    for target, delay in slow:
+        found = False
+        for screen in screens.values():
+            if target in screen["on_click"]:
+                next_state, _ = screen["on_click"][target]
+                screen["on_click"][target] = (next_state, delay)
+                found = True
+        if not found:
+            raise SystemExit(f"没有画面会响应对 {target} 的点击")
+    return screens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GameBot 全流程模拟")
+    parser.add_argument("--assets", default="assets", help="样板目录")
+    parser.add_argument("--config", default="config.json", help="读取其中 matcher / scheduler / interrupts 段")
+    parser.add_argument("--initial", default="desktop", choices=sorted(DEFAULT_SCREENS), help="初始画面")
+    parser.add_argument("--interrupt", action="append", type=parse_interrupt, default=[],
+                        metavar="时刻:目标", help="在虚拟时刻弹出中断，可重复指定")
+    parser.add_argument("--slow", action="append", type=parse_slow, default=[],
+                        metavar="目标:秒", help="延长点击该目标后的界面切换时间，可重复指定")
+    parser.add_argument("--trace", metavar="PATH", help="导出各阶段耗时的 Chrome trace JSON")
+    parser.add_argument("--log-file", default="simulate_run.log", help="日志文件")
+    args = parser.parse_args()
+
+    config = {}
+    if os.path.exists(args.config):
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+
+    log = logger.setup_logger(args.log_file)
+    clock = VirtualClock()
+    tracer = Tracer(enabled=bool(args.trace))
+    game = SimulatedGame(clock, assets_dir=args.assets, screens=build_screens(args.slow), initial=args.initial,
+                         interrupts=args.interrupt, log=log)
+
+    matcher_options = dict(config.get("matcher", {}))
+    matcher_options.update({
+        "capture_backend": game,
+        # 模拟画面与真实画面的位置不同，不读写真实运行的先验和缓存文件
+        "prior_file": None,
+        "scale_cache_file": None,
+        "stats_file": None,
+    })
+    # 后台线程按真实时间运行，模拟时中断检测和截屏都在主流程中同步完成
+    interrupt_options = dict(config.get("interrupts", {}), background=False)
+
+    bot = GameBot(
+        confidence=config.get("settings", {}).get("click_confidence", 0.8),
+        assets_dir=args.assets,
+        log=log,
+        matcher_options=matcher_options,
+        scheduler_options=config.get("scheduler"),
+        interrupt_options=interrupt_options,
+        capture_options=None,
+        input_backend=game,
+        clock=clock.monotonic,
+        sleep=clock.sleep,
+        tracer=tracer
+    )
+
+    started = time.perf_counter()
+    result = bot.run()
+    elapsed = time.perf_counter() - started
+
+    print("")
+    print("画面变化:")
+    for at, state in game.history:
+        print(f"  {at:8.2f}s  {state}")
+    print(f"点击 {len(game.clicks)} 次，截屏 {game.grabs} 次")
+    print(f"虚拟时间 {clock.monotonic():.1f} 秒，实际耗时 {elapsed:.2f} 秒")
+    if args.trace:
+        tracer.log_summary(log)
+        tracer.export_chrome_trace(args.trace)
+
+    if result["success"]:
+        print(f"RESULT: SUCCESS | 步骤: {result['completed_steps']}/{result['total_steps']}")
+        sys.exit(0)
+    print(f"RESULT: FAILED | 失败步骤: {result['failed_step']} | 已完成: {result['completed_steps']}/{result['total_steps']}")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
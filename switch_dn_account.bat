@@ -37,7 +37,8 @@ echo [BATCH] 启动账号切换脚本...
 echo.
 
 :: Run the python script and capture exit code
-"%PY_EXE%" main_controller.py
+:: daemon_client.py 把请求交给常驻进程 (main_controller.py --daemon)，常驻进程未运行时直接执行 main_controller.py
+"%PY_EXE%" daemon_client.py
 set EXIT_CODE=%errorlevel%
 
 echo.